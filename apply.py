@@ -1,13 +1,22 @@
 import os
+import sys
 import base64
 from obswebsocket import obsws, requests
 from PIL import Image
 import json
 from pathlib import Path
-import io
+import time
+import geometry
+from layout_format import load_layout
+from packer import pack_layout
+from frames import FingerprintHistory, FramePool
+from profiles import ProfileStore, frame_fingerprint, hamming_distance
+from obs_batch import ObsBatchSession
+from template_index import TemplateIndex, profile_regions
+from verification import item_rect, score_boxes
 
 class RekordboxTransformAutomator:
-    def __init__(self, host="localhost", port=4455, password=None):
+    def __init__(self, host="localhost", port=4455, password=None, build=False):
         self.host = host
         self.port = port
         self.password = password
@@ -16,6 +25,38 @@ class RekordboxTransformAutomator:
         self.template_folder = "selected_boxes"
         self.templates = {}
         self.source_screenshot = None
+        self.source_resolution = None
+        self.capture_name = "Rekordbox Capture 1"
+        self.profiles = ProfileStore().load()
+        self.canvas_size = None  # OBS base canvas, looked up on first use
+        self.reference_canvas = (1920, 1080)  # Canvas the built-in arrangement is designed on
+        self.layout_path = None  # Optional format.py layout to apply instead
+        
+        # Build mode crops every box out of one shared capture instead of
+        # tweaking pre-made "Rekordbox Capture N" inputs
+        self.build = build
+        self.shared_capture_name = "Rekordbox Capture"
+        self.capture_kind = "window_capture"
+        self.capture_window = None  # OBS "window" setting for a new capture, title:class:exe
+        self.batch = None
+        if build:
+            self.capture_name = self.shared_capture_name
+        self.box_sources = {}
+        self.overlay_items = {}
+        self.template_images = {}  # In-memory templates, used instead of reading selected_boxes
+        
+        # Verification of the composed scene after transforms are applied
+        self.verify = True
+        self.verify_threshold = 0.5
+        self.verify_width = 480  # Width of the program frame used for checking
+        self.verify_delay = 0.5  # Seconds to let OBS render before checking again
+        
+        # Screenshots are decoded into reused buffers; watch mode keeps a capped
+        # history of low resolution fingerprints to notice layout changes
+        self.frames = FramePool()
+        self.history = FingerprintHistory()
+        self.watch_size = (320, 180)
+        self.watch_interval = 2.0  # Seconds between watch screenshots
         
     def connect_obs(self):
         """Establish connection to OBS WebSocket."""
@@ -23,6 +64,9 @@ class RekordboxTransformAutomator:
             self.ws = obsws(self.host, self.port, self.password)
             self.ws.connect()
             print("Connected to OBS WebSocket")
+            if self.build:
+                self.batch = ObsBatchSession(self.host, self.port, self.password)
+                self.batch.connect()
             return True
         except Exception as e:
             print(f"Failed to connect to OBS: {e}")
@@ -34,9 +78,22 @@ class RekordboxTransformAutomator:
             print(f"Template folder '{self.template_folder}' not found")
             return False
             
-        for file in os.listdir(self.template_folder):
+        # Templates of a panel that is already loaded would only add matching work and scene items.
+        # Duplicates can only be told apart by the regions recorded when the templates were
+        # saved; without them lookalikes are reported but every template is kept
+        index = TemplateIndex()
+        regions = profile_regions(self.find_region_profile()) if self.source_screenshot else {}
+        for file in sorted(os.listdir(self.template_folder)):
             if file.endswith('.png'):
                 template_img = Image.open(os.path.join(self.template_folder, file))
+                duplicate = index.duplicate_of(template_img, regions.get(file), regions)
+                if duplicate:
+                    print(f"Skipping template {file}, same panel as {duplicate}")
+                    continue
+                lookalikes = index.lookalikes(template_img)
+                if lookalikes:
+                    print(f"Template {file} looks like {', '.join(lookalikes)}")
+                index.add(file, template_img)
                 self.templates[file] = {
                     'width': template_img.width,
                     'height': template_img.height,
@@ -45,7 +102,7 @@ class RekordboxTransformAutomator:
         print(f"Loaded {len(self.templates)} templates")
         return len(self.templates) > 0
 
-    def capture_source_screenshot(self):
+    def capture_source_screenshot(self, size=(1920, 1080)):
         """Capture a screenshot of the current Rekordbox window."""
         try:
             # First, get all inputs to verify the capture exists
@@ -54,37 +111,14 @@ class RekordboxTransformAutomator:
             # Debug print the response
             print("Available inputs:", [input.get('inputName', '') for input in inputs_response.datain.get('inputs', [])])
             
-            capture_name = "Rekordbox Capture 1"
+            capture_name = self.capture_name
             if not any(input.get('inputName') == capture_name for input in inputs_response.datain.get('inputs', [])):
                 print(f"Source '{capture_name}' not found in OBS")
                 return False
 
-            # Get source screenshot using OBS
-            response = self.ws.call(requests.GetSourceScreenshot(
-                sourceName=capture_name,
-                imageFormat="png",
-                imageWidth=1920,
-                imageHeight=1080
-            ))
-            
-            # Debug print the response
-            print("Screenshot response:", response.datain)
-            
-            # The response contains the image data in base64 format
-            img_data = response.datain.get('imageData')
-            if not img_data:
-                print("No image data received from OBS")
+            self.source_screenshot = self.capture_frame(size)
+            if not self.source_screenshot:
                 return False
-
-            # Remove the data URI prefix if present
-            if img_data.startswith('data:image/png;base64,'):
-                img_data = img_data.split(',')[1]
-
-            # Decode base64 to bytes
-            img_bytes = base64.b64decode(img_data)
-            
-            # Convert to PIL Image
-            self.source_screenshot = Image.open(io.BytesIO(img_bytes))
             print(f"Successfully captured screenshot: {self.source_screenshot.size}")
             return True
             
@@ -94,6 +128,95 @@ class RekordboxTransformAutomator:
             traceback.print_exc()
             return False
 
+    def capture_frame(self, size):
+        """Screenshot the capture into the frame pool, without checks or logging."""
+        response = self.ws.call(requests.GetSourceScreenshot(
+            sourceName=self.capture_name,
+            imageFormat="png",
+            imageWidth=size[0],
+            imageHeight=size[1]
+        ))
+        return self.decode_screenshot(response)
+
+    def decode_screenshot(self, response):
+        """Turn a GetSourceScreenshot response into a PIL image backed by the frame pool."""
+        # The response contains the image data in base64 format
+        img_data = response.datain.get('imageData')
+        if not img_data:
+            print("No image data received from OBS")
+            return None
+
+        # Remove the data URI prefix if present
+        if img_data.startswith('data:image/png;base64,'):
+            img_data = img_data.split(',')[1]
+
+        # Decode base64 to bytes
+        img_bytes = base64.b64decode(img_data)
+        
+        # Decode into a reused buffer instead of a fresh image
+        return self.frames.decode(img_bytes)
+
+    def detect_source_resolution(self):
+        """Read the native resolution of the Rekordbox capture from its scene item."""
+        try:
+            scene_items_response = self.ws.call(requests.GetSceneItemList(sceneName=self.scene_name))
+            for item in scene_items_response.getSceneItems():
+                if item['sourceName'] == self.capture_name:
+                    transform_response = self.ws.call(requests.GetSceneItemTransform(
+                        sceneName=self.scene_name,
+                        sceneItemId=item['sceneItemId']
+                    ))
+                    transform = transform_response.datain.get('sceneItemTransform', {})
+                    width = int(transform.get('sourceWidth', 0))
+                    height = int(transform.get('sourceHeight', 0))
+                    if width and height:
+                        self.source_resolution = (width, height)
+                        break
+        except Exception as e:
+            print(f"Failed to read source resolution: {e}")
+
+        # Fall back to the screenshot size if OBS did not report one
+        if not self.source_resolution and self.source_screenshot:
+            self.source_resolution = self.source_screenshot.size
+        print(f"Source resolution: {self.source_resolution}")
+        return self.source_resolution is not None
+
+    def find_profile(self):
+        """Look up a stored layout profile matching the current capture."""
+        width, height = self.source_resolution
+        fingerprint = frame_fingerprint(self.source_screenshot)
+        profile = self.profiles.find(width, height, fingerprint)
+        if profile and profile.get(self.profile_field()):
+            print(f"Matched profile '{profile['id']}' for {width}x{height}")
+            return profile
+        print(f"No profile for {width}x{height} (fingerprint {fingerprint})")
+        return None
+
+    def profile_field(self):
+        """Profile key holding the transforms for the current mode."""
+        return 'overlay' if self.build else 'transforms'
+
+    def store_profile(self, transforms):
+        """Save the template set and transforms for the current capture."""
+        width, height = self.source_resolution
+        fingerprint = frame_fingerprint(self.source_screenshot)
+        profile = self.profiles.put(width, height, fingerprint, templates=self.templates,
+                                    sources=self.box_sources, **{self.profile_field(): transforms})
+        try:
+            self.profiles.save()
+            print(f"Stored profile '{profile['id']}'")
+        except OSError as e:
+            print(f"Failed to store profile: {e}")
+
+    def get_canvas_size(self):
+        """Base canvas size of OBS, or 1920x1080 when not connected."""
+        if self.canvas_size is None:
+            if self.ws is None:
+                return (1920, 1080)
+            video = self.ws.call(requests.GetVideoSettings()).datain
+            self.canvas_size = (video.get('baseWidth', 1920), video.get('baseHeight', 1080))
+        return self.canvas_size
+
     def calculate_transforms(self):
         """Calculate the necessary transforms to match templates."""
         if not self.source_screenshot:
@@ -104,7 +227,7 @@ class RekordboxTransformAutomator:
         source_height = self.source_screenshot.height
         print(f"Source dimensions: {source_width}x{source_height}")
         
-        transforms = {}
+        self.box_sources = {}
         
         # Sort templates by size (assuming larger templates are for the main deck views)
         sorted_templates = sorted(
@@ -113,13 +236,14 @@ class RekordboxTransformAutomator:
             reverse=True
         )
         
-        # Calculate base position for center alignment
-        base_x = 1920 // 2  # Assuming 1920x1080 canvas
-        base_y = 1080 // 2
+        # Boxes are placed on a 1920x1080 reference canvas around its centre
+        # and mapped onto the real OBS canvas together at the end
+        base_x = self.reference_canvas[0] // 2
+        base_y = self.reference_canvas[1] // 2
+        boxes = geometry.empty(len(sorted_templates))
         
         for i, (template_name, template_data) in enumerate(sorted_templates):
             # Calculate scale to match template aspect ratio
-            target_ar = template_data['aspect_ratio']
             scale = min(
                 template_data['width'] / source_width,
                 template_data['height'] / source_height
@@ -133,28 +257,64 @@ class RekordboxTransformAutomator:
                 x_offset = ((i-2) * 300) - 150
                 y_offset = 300
             
-            source_name = f"Rekordbox Capture {i+1}"
-            transforms[source_name] = {
-                "positionX": base_x + x_offset,
-                "positionY": base_y + y_offset,
-                "rotation": 0.0,
-                "scaleX": scale,
-                "scaleY": scale,
-                "cropLeft": 0,
-                "cropRight": 0,
-                "cropTop": 0,
-                "cropBottom": 0,
-                "sourceWidth": source_width,
-                "sourceHeight": source_height,
-                "width": source_width,
-                "height": source_height,
-                "alignment": 0
-            }
-            
-            print(f"Calculated transform for {source_name}: scale={scale:.2f}, pos=({base_x + x_offset}, {base_y + y_offset})")
+            width, height = source_width * scale, source_height * scale
+            boxes[i] = (base_x + x_offset - width / 2, base_y + y_offset - height / 2,
+                        width, height, 0, 0, 0, 0, 0)
+            self.box_sources[f"Rekordbox Capture {i+1}"] = template_name
             
+        mapped = geometry.to_obs_transforms(boxes, [(source_width, source_height)] * len(boxes),
+                                            self.reference_canvas, self.get_canvas_size())
+        transforms = dict(zip(self.box_sources, mapped))
+        for source_name, transform in transforms.items():
+            print(f"Calculated transform for {source_name}: scale={transform['scaleX']:.2f}, "
+                  f"pos=({transform['positionX']:.0f}, {transform['positionY']:.0f})")
         return transforms
 
+    def find_region_profile(self):
+        """Closest profile with regions for the current capture, even if the fingerprint differs."""
+        width, height = self.source_resolution
+        fingerprint = frame_fingerprint(self.source_screenshot)
+        return self.profiles.find_regions(width, height, fingerprint)
+
+    def recorded_regions(self):
+        """Regions of the closest profile for the current capture, by template name."""
+        profile = self.find_region_profile()
+        return {r['name']: r for r in profile.get('regions', [])} if profile else {}
+
+    def transforms_from_layout(self, layout):
+        """Map a format.py layout onto the OBS canvas in one call.
+
+        Each box is matched to its recorded region by template file name, so
+        its crop is the region inside the capture plus the layout's own crop.
+        """
+        regions = self.recorded_regions()
+        width, height = self.source_resolution
+        self.box_sources = {}
+        boxes = geometry.from_layout(layout)
+        keep = []
+        for i, box in enumerate(layout.boxes):
+            template_name = os.path.basename(box.path)
+            region = regions.get(template_name)
+            if region is None or not box.placed:
+                print(f"No region recorded for '{template_name}' at {width}x{height}, skipping")
+                continue
+            boxes[i]['crop_l'] += region['x1']
+            boxes[i]['crop_t'] += region['y1']
+            boxes[i]['crop_r'] += width - region['x2']
+            boxes[i]['crop_b'] += height - region['y2']
+            keep.append(i)
+            if not self.build:
+                self.box_sources[f"Rekordbox Capture {len(keep)}"] = template_name
+
+        boxes = boxes[keep]
+        mapped = geometry.to_obs_transforms(boxes, [(width, height)] * len(boxes),
+                                            layout.canvas_size, self.get_canvas_size())
+        if self.build:
+            names = [os.path.basename(layout.boxes[i].path) for i in keep]
+        else:
+            names = list(self.box_sources)
+        return dict(zip(names, mapped))
+
     def apply_transforms(self, transforms):
         """Apply the calculated transforms to OBS sources."""
         try:
@@ -181,30 +341,316 @@ class RekordboxTransformAutomator:
             print(f"Failed to apply transforms: {str(e)}")
             return False
 
+    def ensure_capture_input(self):
+        """Create the shared Rekordbox capture input unless it already exists.
+
+        A new capture needs the Rekordbox window to be known, otherwise OBS
+        captures nothing and every later step would work on a blank frame.
+        """
+        try:
+            inputs_response = self.ws.call(requests.GetInputList())
+            if any(input.get('inputName') == self.shared_capture_name
+                   for input in inputs_response.datain.get('inputs', [])):
+                return True
+            if not self.capture_window:
+                print(f"No input named '{self.shared_capture_name}'. Add a {self.capture_kind} with that name "
+                      f"in OBS and pick the Rekordbox window, or pass --window to create it")
+                return False
+            # Creating the input also adds its first scene item to the scene
+            self.ws.call(requests.CreateInput(
+                sceneName=self.scene_name,
+                inputName=self.shared_capture_name,
+                inputKind=self.capture_kind,
+                inputSettings={'window': self.capture_window},
+                sceneItemEnabled=True
+            ))
+            print(f"Created input '{self.shared_capture_name}' ({self.capture_kind})")
+            return True
+        except Exception as e:
+            print(f"Failed to create capture input: {e}")
+            return False
+
+    def auto_layout(self):
+        """Pack the templates with a recorded region onto the OBS canvas."""
+        regions = self.recorded_regions()
+        names = [name for name in sorted(self.templates) if name in regions]
+        if not names:
+            return None
+        sizes = [(regions[name]['x2'] - regions[name]['x1'], regions[name]['y2'] - regions[name]['y1'])
+                 for name in names]
+        origins = [(regions[name]['x1'], regions[name]['y1']) for name in names]
+        print(f"Auto-arranging {len(names)} boxes")
+        return pack_layout(names, sizes, self.get_canvas_size(), origins=origins)
+
+    def calculate_layout(self):
+        """Transforms from the layout file if given, else the packer, else the fixed arrangement.
+
+        The packer needs the regions of the boxes inside the capture, so
+        setups without recorded regions keep the fixed arrangement.
+        """
+        if self.layout_path:
+            layout = load_layout(self.layout_path)
+            if layout.pending_ops:
+                # The snapshot is older than what format.py shows; applying it would drift
+                print(f"Layout '{self.layout_path}' has {layout.pending_ops} edits logged after its "
+                      f"snapshot. Export it from format.py again before applying it")
+                return None
+            return self.transforms_from_layout(layout)
+        layout = self.auto_layout()
+        if layout is not None:
+            return self.transforms_from_layout(layout)
+        transforms = self.calculate_transforms()
+        if transforms and self.build:
+            transforms = self.calculate_overlay(transforms)
+            if not transforms:
+                print("No recorded regions to build the overlay from")
+        return transforms
+
+    def calculate_overlay(self, transforms):
+        """Turn per-capture transforms into cropped items of the shared capture."""
+        width, height = self.source_resolution
+        regions = self.recorded_regions()
+
+        names = []
+        boxes = geometry.empty(len(transforms))
+        for source_name, transform in transforms.items():
+            template_name = self.box_sources[source_name]
+            region = regions.get(template_name)
+            if region is None:
+                print(f"No region recorded for '{template_name}' at {width}x{height}, skipping")
+                continue
+            # Unscaled crops of the capture, centred where the capture was
+            box_width, box_height = region['x2'] - region['x1'], region['y2'] - region['y1']
+            boxes[len(names)] = (transform["positionX"] - box_width / 2, transform["positionY"] - box_height / 2,
+                                 box_width, box_height, transform["rotation"],
+                                 region['x1'], region['y1'], width - region['x2'], height - region['y2'])
+            names.append(template_name)
+
+        canvas_size = self.get_canvas_size()
+        boxes = boxes[:len(names)]
+        return dict(zip(names, geometry.to_obs_transforms(boxes, [(width, height)] * len(boxes),
+                                                          canvas_size, canvas_size)))
+
+    def build_overlay(self, overlay):
+        """Create or reuse one scene item per box and set all of them in batches."""
+        try:
+            scene_items_response = self.ws.call(requests.GetSceneItemList(sceneName=self.scene_name))
+            items = sorted((item for item in scene_items_response.getSceneItems()
+                            if item['sourceName'] == self.shared_capture_name),
+                           key=lambda item: item['sceneItemIndex'])
+            item_ids = [item['sceneItemId'] for item in items]
+            names = sorted(overlay)
+
+            # Items have to exist before their IDs can be used, so add or
+            # remove them first; a matching scene skips this batch entirely
+            changes = [requests.CreateSceneItem(sceneName=self.scene_name,
+                                                sourceName=self.shared_capture_name)
+                       for _ in range(len(names) - len(item_ids))]
+            changes += [requests.RemoveSceneItem(sceneName=self.scene_name, sceneItemId=item_id)
+                        for item_id in item_ids[len(names):]]
+            for result in self.batch.call_batch(changes):
+                if not result['requestStatus']['result']:
+                    print(f"{result['requestType']} failed: {result['requestStatus'].get('comment')}")
+                elif result['requestType'] == 'CreateSceneItem':
+                    item_ids.append(result['responseData']['sceneItemId'])
+
+            updates = []
+            self.overlay_items = dict(zip(item_ids, names))
+            for name, item_id in zip(names, item_ids):
+                updates.append(requests.SetSceneItemTransform(
+                    sceneName=self.scene_name,
+                    sceneItemId=item_id,
+                    sceneItemTransform=overlay[name]
+                ))
+                updates.append(requests.SetSceneItemEnabled(
+                    sceneName=self.scene_name,
+                    sceneItemId=item_id,
+                    sceneItemEnabled=True
+                ))
+            failures = [result for result in self.batch.call_batch(updates)
+                        if not result['requestStatus']['result']]
+            for result in failures:
+                print(f"{result['requestType']} failed: {result['requestStatus'].get('comment')}")
+            print(f"Built overlay with {min(len(names), len(item_ids))} boxes from '{self.shared_capture_name}'")
+            return not failures
+        except Exception as e:
+            print(f"Failed to build overlay: {str(e)}")
+            return False
+
+    def apply_layout(self, transforms):
+        """Apply transforms in the current mode."""
+        if self.build:
+            return self.build_overlay(transforms)
+        return self.apply_transforms(transforms)
+
+    def capture_program_frame(self):
+        """Take one low resolution screenshot of the composed scene."""
+        canvas_size = self.get_canvas_size()
+        response = self.ws.call(requests.GetSourceScreenshot(
+            sourceName=self.scene_name,
+            imageFormat="png",
+            imageWidth=self.verify_width,
+            imageHeight=round(self.verify_width * canvas_size[1] / canvas_size[0])
+        ))
+        return self.decode_screenshot(response), canvas_size
+
+    def cropped(self, transforms):
+        """Whether every item is cropped to its template's region.
+
+        The fixed arrangement shows each whole capture scaled down, which
+        never looks like a single panel, so only cropped layouts can fail
+        verification.
+        """
+        return bool(transforms) and all(
+            any(transform.get(side) for side in ('cropLeft', 'cropRight', 'cropTop', 'cropBottom'))
+            for transform in transforms.values())
+
+    def verify_layout(self, enforce=True):
+        """Check that every box shows its template; returns False if any scores low.
+
+        With `enforce` off the scores are only reported.
+        """
+        if not self.verify:
+            return True
+        try:
+            frame, canvas_size = self.capture_program_frame()
+            if frame is None:
+                print("Skipping verification, no program frame")
+                return True
+
+            scene_items_response = self.ws.call(requests.GetSceneItemList(sceneName=self.scene_name))
+            boxes = {}
+            for item in scene_items_response.getSceneItems():
+                if self.build:
+                    template_name = self.overlay_items.get(item['sceneItemId'])
+                else:
+                    template_name = self.box_sources.get(item['sourceName'])
+                template_path = os.path.join(self.template_folder, template_name or "")
+                if template_name in self.template_images:
+                    template = self.template_images[template_name]
+                elif template_name and os.path.exists(template_path):
+                    template = Image.open(template_path)
+                else:
+                    continue
+                transform = item.get('sceneItemTransform')
+                if transform is None:
+                    transform = self.ws.call(requests.GetSceneItemTransform(
+                        sceneName=self.scene_name,
+                        sceneItemId=item['sceneItemId']
+                    )).datain.get('sceneItemTransform', {})
+                boxes[template_name] = (template, item_rect(transform),
+                                        transform.get('rotation', 0))
+
+            scores = score_boxes(frame, boxes, canvas_size)
+            for name, score in sorted(scores.items()):
+                status = "ok" if score >= self.verify_threshold else "LOW"
+                print(f"Verification {name}: {score:.2f} {status}")
+            if not enforce:
+                print("Items are not cropped to their templates, scores are for information only")
+                return True
+            return all(score >= self.verify_threshold for score in scores.values())
+        except Exception as e:
+            print(f"Skipping verification: {str(e)}")
+            return True
+
+    def disconnect_obs(self):
+        if self.batch:
+            self.batch.disconnect()
+        if self.ws:
+            self.ws.disconnect()
+            print("Disconnected from OBS WebSocket")
+
+    def setup(self):
+        """Capture, lay out, apply and verify the overlay on an open connection."""
+        if self.build and not self.ensure_capture_input():
+            return False
+            
+        if not self.capture_source_screenshot():
+            return False
+
+        if not self.detect_source_resolution():
+            return False
+
+        # A known resolution and layout can reuse its cached transforms,
+        # unless a layout file was given explicitly
+        profile = None if self.layout_path else self.find_profile()
+        if profile:
+            self.templates = profile.get('templates', {})
+            self.box_sources = profile.get('sources', {})
+            cached = profile[self.profile_field()]
+            if self.apply_layout(cached) and self.verify_layout(self.cropped(cached)):
+                return True
+            print("Cached profile failed verification, falling back to full matching")
+
+        # Start from the template folder alone; a failed profile or an earlier
+        # setup in watch mode must not leave its templates behind
+        self.templates = {}
+        self.box_sources = {}
+        self.template_images = {}
+        if not self.load_templates():
+            print("No templates found")
+            return False
+            
+        transforms = self.calculate_layout()
+        if not transforms:
+            print("No transforms to apply")
+            return False
+        enforce = self.cropped(transforms)
+        success = self.apply_layout(transforms)
+        if success and not self.verify_layout(enforce):
+            # OBS may not have rendered the new layout yet, so try once more
+            time.sleep(self.verify_delay)
+            success = self.apply_layout(transforms) and self.verify_layout(enforce)
+            if not success:
+                print("Layout failed verification, not storing a profile")
+        if success:
+            self.store_profile(transforms)
+        
+        return success
+
     def run(self):
         """Main execution flow."""
         try:
             if not self.connect_obs():
                 return False
-                
-            if not self.load_templates():
-                print("No templates found")
-                return False
-                
-            if not self.capture_source_screenshot():
-                return False
-                
-            transforms = self.calculate_transforms()
-            if not transforms:
+            return self.setup()
+        finally:
+            self.disconnect_obs()
+
+    def watch(self, iterations=None):
+        """Set up the overlay, then set it up again whenever the Rekordbox layout changes.
+
+        Changes are spotted from small screenshots whose fingerprints drift
+        further than the profile store tolerates. `iterations` limits the
+        number of screenshots, for testing; by default it runs until stopped.
+        """
+        try:
+            if not self.connect_obs():
                 return False
-                
-            success = self.apply_transforms(transforms)
-            
-            return success
+            self.setup()
+            baseline = None
+            count = 0
+            while iterations is None or count < iterations:
+                count += 1
+                frame = self.capture_frame(self.watch_size)
+                if frame is not None:
+                    fingerprint = self.history.add(frame)
+                    if baseline is None:
+                        baseline = fingerprint
+                    elif hamming_distance(fingerprint, baseline) > self.profiles.max_distance:
+                        print("Rekordbox layout changed, setting up again")
+                        # The capture or canvas may have been resized along with it
+                        self.source_resolution = None
+                        self.canvas_size = None
+                        self.setup()
+                        baseline = fingerprint
+                time.sleep(self.watch_interval)
+            return True
+        except KeyboardInterrupt:
+            print("Stopped watching")
+            return True
         finally:
-            if self.ws:
-                self.ws.disconnect()
-                print("Disconnected from OBS WebSocket")
+            self.disconnect_obs()
 
 def main():
     # Load password from environment variable
@@ -213,7 +659,20 @@ def main():
         print("OBS_PASSWORD environment variable not set")
         return
     
-    automator = RekordboxTransformAutomator(password=password)
+    # --build creates the overlay from one shared capture instead of adjusting existing inputs
+    automator = RekordboxTransformAutomator(password=password, build="--build" in sys.argv[1:])
+    # --no-verify skips the screenshot check of the composed scene
+    automator.verify = "--no-verify" not in sys.argv[1:]
+    # --window WINDOW is the Rekordbox window a new --build capture is created for
+    if "--window" in sys.argv[1:-1]:
+        automator.capture_window = sys.argv[sys.argv.index("--window") + 1]
+    # --layout FILE.rbl places the boxes as arranged in format.py
+    if "--layout" in sys.argv[1:-1]:
+        automator.layout_path = sys.argv[sys.argv.index("--layout") + 1]
+    # --watch keeps running and sets the overlay up again when Rekordbox's layout changes
+    if "--watch" in sys.argv[1:]:
+        automator.watch()
+        return
     success = automator.run()
     
     if success:
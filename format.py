@@ -1,6 +1,13 @@
 import sys
 import re
+import numpy as np
 from PyQt5 import QtCore, QtGui, QtWidgets
+import geometry
+from packer import pack_layout
+from layout_format import Layout, LayoutBox, append_op, format_op, load_layout, parse_command, save_layout
+
+# Sides in clockwise order, used to follow crops through 90 degree rotations
+CLOCKWISE_SIDES = ['top', 'right', 'bottom', 'left']
 
 class ImageItem(QtWidgets.QGraphicsPixmapItem):
     def __init__(self, pixmap, index):
@@ -10,6 +17,32 @@ class ImageItem(QtWidgets.QGraphicsPixmapItem):
         self.default_opacity = 1.0
         self.hover_opacity = 0.6
         self.original_pixmap = pixmap.copy()
+        # State relative to the source file, kept for layout export
+        self.path = None
+        self.source_size = (pixmap.width(), pixmap.height())
+        self.pixmap_rotation = 0
+        self.source_crop = [0.0, 0.0, 0.0, 0.0]  # left, top, right, bottom in source pixels
+
+    def source_crop_side(self, side, amount):
+        """Map a crop of the displayed pixmap to a side and amount in source pixels."""
+        steps = round(self.pixmap_rotation / 90) % 4
+        source_side = CLOCKWISE_SIDES[(CLOCKWISE_SIDES.index(side) - steps) % 4]
+        left, top, right, bottom = self.source_crop
+        if source_side in ('left', 'right'):
+            source_extent = self.source_size[0] - left - right
+            shown_extent = self.pixmap().width() if steps % 2 == 0 else self.pixmap().height()
+        else:
+            source_extent = self.source_size[1] - top - bottom
+            shown_extent = self.pixmap().height() if steps % 2 == 0 else self.pixmap().width()
+        return source_side, amount * source_extent / max(1, shown_extent)
+
+    def layout_box(self):
+        """Final state of this item as a layout record."""
+        width, height = self.pixmap().width(), self.pixmap().height()
+        if round(self.pixmap_rotation / 90) % 2 == 1:
+            width, height = height, width
+        return LayoutBox(self.path, self.pos().x(), self.pos().y(), width, height,
+                         self.pixmap_rotation, self.source_crop)
 
     def hoverEnterEvent(self, event):
         self.setOpacity(self.hover_opacity)
@@ -27,6 +60,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.images = []
         self.selected_image_index = None
         self.command_history = []
+        self.op_log = []
+        self.layout_path = None  # Layout file that new ops are appended to
         self.init_ui()
 
     def init_ui(self):
@@ -88,12 +123,15 @@ class MainWindow(QtWidgets.QMainWindow):
 
         for idx, path in enumerate(self.image_paths):
             pixmap = QtGui.QPixmap(path)
+            source_size = (pixmap.width(), pixmap.height())
             # Scale images to fit within cell size
             pixmap = pixmap.scaled(int(cell_width * 0.8),
                                    int(cell_height * 0.8),
                                    QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
 
             image_item = ImageItem(pixmap, idx)
+            image_item.path = path
+            image_item.source_size = source_size
             image_item.setFlags(QtWidgets.QGraphicsItem.ItemIsSelectable)
 
             # Compute position
@@ -204,6 +242,11 @@ class MainWindow(QtWidgets.QMainWindow):
         snap_to_image_btn.clicked.connect(lambda: self.snap_to_image())
         layout.addWidget(snap_to_image_btn, 2, 3)
 
+        # Auto layout button
+        auto_layout_btn = QtWidgets.QPushButton("Auto Layout")
+        auto_layout_btn.clicked.connect(self.auto_layout)
+        layout.addWidget(auto_layout_btn, 2, 4)
+
         self.control_panel.setLayout(layout)
 
     def create_command_list_view(self):
@@ -217,8 +260,14 @@ class MainWindow(QtWidgets.QMainWindow):
         import_btn.clicked.connect(self.import_commands)
         export_btn = QtWidgets.QPushButton("Export Commands")
         export_btn.clicked.connect(self.export_commands)
+        import_layout_btn = QtWidgets.QPushButton("Import Layout")
+        import_layout_btn.clicked.connect(self.import_layout)
+        export_layout_btn = QtWidgets.QPushButton("Export Layout")
+        export_layout_btn.clicked.connect(self.export_layout)
         import_export_layout.addWidget(import_btn)
         import_export_layout.addWidget(export_btn)
+        import_export_layout.addWidget(import_layout_btn)
+        import_export_layout.addWidget(export_layout_btn)
         self.import_export_widget.setLayout(import_export_layout)
 
     def select_image(self, index):
@@ -242,6 +291,7 @@ class MainWindow(QtWidgets.QMainWindow):
         if image_item:
             pixmap = image_item.pixmap().transformed(QtGui.QTransform().rotate(angle), QtCore.Qt.SmoothTransformation)
             image_item.setPixmap(pixmap)
+            image_item.pixmap_rotation = (image_item.pixmap_rotation + angle) % 360
             self.log_command(f"Rotated Image {self.selected_image_index + 1} by {angle} degrees")
 
     def scale_image(self, fit_vertical=False):
@@ -333,6 +383,8 @@ class MainWindow(QtWidgets.QMainWindow):
                 QtWidgets.QMessageBox.warning(self, "Invalid Side",
                                               f"Invalid side '{side}' for cropping. Please choose 'left', 'right', 'top', or 'bottom'.")
                 return
+            source_side, source_amount = image_item.source_crop_side(side, crop_amount)
+            image_item.source_crop[['left', 'top', 'right', 'bottom'].index(source_side)] += source_amount
             cropped_pixmap = pixmap.copy(rect)
             image_item.setPixmap(cropped_pixmap)
             self.log_command(f"Cropped {crop_amount}px from {side} of Image {self.selected_image_index + 1}")
@@ -341,6 +393,8 @@ class MainWindow(QtWidgets.QMainWindow):
         image_item = self.get_selected_image()
         if image_item:
             image_item.setPixmap(image_item.original_pixmap)
+            image_item.pixmap_rotation = 0
+            image_item.source_crop = [0.0, 0.0, 0.0, 0.0]
             self.center_image()
             self.log_command(f"Reset crop of Image {self.selected_image_index + 1}")
 
@@ -358,19 +412,15 @@ class MainWindow(QtWidgets.QMainWindow):
     def center_image_horizontally(self):
         image_item = self.get_selected_image()
         if image_item:
-            scene_width = self.scene.width()
-            img_width = image_item.pixmap().width()
-            x = (scene_width - img_width) / 2
-            image_item.setPos(x, image_item.pos().y())
+            self.place_images(geometry.center(self.box_records(), self.canvas_size(), vertical=False,
+                                              mask=self.selection_mask()))
             self.log_command(f"Centered Image {self.selected_image_index + 1} horizontally")
 
     def center_image_vertically(self):
         image_item = self.get_selected_image()
         if image_item:
-            scene_height = self.scene.height()
-            img_height = image_item.pixmap().height()
-            y = (scene_height - img_height) / 2
-            image_item.setPos(image_item.pos().x(), y)
+            self.place_images(geometry.center(self.box_records(), self.canvas_size(), horizontal=False,
+                                              mask=self.selection_mask()))
             self.log_command(f"Centered Image {self.selected_image_index + 1} vertically")
 
     def snap_to_canvas(self, side=None):
@@ -381,23 +431,12 @@ class MainWindow(QtWidgets.QMainWindow):
                                                           "Select side to snap to:", ["left", "right", "top", "bottom"], 0, False)
                 if not ok or not side:
                     return
-            if side == 'right':
-                x = self.scene.sceneRect().width() - image_item.pixmap().width()
-                y = image_item.pos().y()
-            elif side == 'left':
-                x = 0
-                y = image_item.pos().y()
-            elif side == 'top':
-                x = image_item.pos().x()
-                y = 0
-            elif side == 'bottom':
-                x = image_item.pos().x()
-                y = self.scene.sceneRect().height() - image_item.pixmap().height()
-            else:
+            if side not in geometry.SIDES:
                 QtWidgets.QMessageBox.warning(self, "Invalid Side",
                                               f"Invalid side '{side}' for snapping to canvas. Please choose 'left', 'right', 'top', or 'bottom'.")
                 return
-            image_item.setPos(x, y)
+            self.place_images(geometry.snap_to_canvas(self.box_records(), self.canvas_size(), side,
+                                                      mask=self.selection_mask()))
             self.log_command(f"Snapped Image {self.selected_image_index + 1} to canvas {side}")
 
     def snap_to_image(self, other_index=None, side=None):
@@ -417,29 +456,110 @@ class MainWindow(QtWidgets.QMainWindow):
                                                           "Select side to snap to:", ["left", "right", "top", "bottom"], 0, False)
                 if not ok or not side:
                     return
-            other_image = self.images[other_index]
-            if side == 'right':
-                x = other_image.pos().x() + other_image.pixmap().width()
-                y = other_image.pos().y()
-            elif side == 'left':
-                x = other_image.pos().x() - image_item.pixmap().width()
-                y = other_image.pos().y()
-            elif side == 'top':
-                x = other_image.pos().x()
-                y = other_image.pos().y() - image_item.pixmap().height()
-            elif side == 'bottom':
-                x = other_image.pos().x()
-                y = other_image.pos().y() + other_image.pixmap().height()
-            else:
+            if side not in geometry.SIDES:
                 QtWidgets.QMessageBox.warning(self, "Invalid Side",
                                               f"Invalid side '{side}' for snapping to image. Please choose 'left', 'right', 'top', or 'bottom'.")
                 return
-            image_item.setPos(x, y)
+            self.place_images(geometry.snap_to_box(self.box_records(), self.selected_image_index, other_index, side))
             self.log_command(f"Snapped Image {self.selected_image_index + 1} to {side} of Image {other_index + 1}")
 
+    def canvas_size(self):
+        rect = self.scene.sceneRect()
+        return rect.width(), rect.height()
+
+    def box_records(self):
+        """Every image as a geometry box record, in image order."""
+        return geometry.from_layout(self.current_layout())
+
+    def selection_mask(self):
+        mask = np.zeros(len(self.images), dtype=bool)
+        mask[self.selected_image_index] = True
+        return mask
+
+    def place_images(self, boxes):
+        """Move every image to the position of its box record."""
+        for image_item, box in zip(self.images, boxes):
+            if image_item.pos().x() != box['x'] or image_item.pos().y() != box['y']:
+                image_item.setPos(float(box['x']), float(box['y']))
+
+    def auto_layout(self):
+        """Arrange all images with the packer, from their uncropped source sizes."""
+        if not self.images:
+            return
+        self.apply_layout(pack_layout([item.path for item in self.images],
+                                      [item.source_size for item in self.images], self.canvas_size()))
+        self.log_command("Auto-arranged images")
+
     def log_command(self, command_str):
         self.command_history.append(command_str)
         self.command_list_widget.addItem(command_str)
+        op = parse_command(command_str)
+        if op is not None:
+            self.op_log.append(op)
+            # Journal the op so the open layout file can be replayed after a crash
+            if self.layout_path:
+                append_op(self.layout_path, op)
+
+    def current_layout(self):
+        """Snapshot of every image's final state."""
+        return Layout([item.layout_box() for item in self.images], self.canvas_size())
+
+    def export_layout(self):
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Layout", "", "Layout Files (*.rbl)")
+        if file_name:
+            try:
+                # Exporting compacts the op log into the snapshot
+                save_layout(file_name, self.current_layout())
+                self.layout_path = file_name
+                QtWidgets.QMessageBox.information(self, "Export Successful", "Layout exported successfully.")
+            except Exception as e:
+                QtWidgets.QMessageBox.warning(self, "Export Failed", f"An error occurred: {e}")
+
+    def import_layout(self):
+        file_name, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Import Layout", "",
+                                                             "Layout Files (*.rbl);;Text Files (*.txt)")
+        if file_name:
+            try:
+                self.layout_path = None
+                self.command_history = []
+                self.op_log = []
+                self.command_list_widget.clear()
+                self.reset_images()
+                if file_name.endswith('.txt'):
+                    # Old text command files are converted by replaying them once
+                    with open(file_name, 'r') as f:
+                        ops = [op for op in map(parse_command, f.read().splitlines()) if op]
+                    layout = Layout(ops=ops)
+                else:
+                    layout = load_layout(file_name, include_ops=True)
+                self.apply_layout(layout)
+                if not file_name.endswith('.txt'):
+                    self.layout_path = file_name
+                QtWidgets.QMessageBox.information(self, "Import Successful", "Layout imported successfully.")
+            except Exception as e:
+                QtWidgets.QMessageBox.warning(self, "Import Failed", f"An error occurred: {e}")
+
+    def apply_layout(self, layout):
+        """Restore a layout snapshot, then replay any ops logged after it."""
+        for box in layout.boxes:
+            if not box.placed or box.path not in self.image_paths:
+                continue
+            image_item = self.images[self.image_paths.index(box.path)]
+            source = QtGui.QPixmap(box.path)
+            left, top, right, bottom = box.crop
+            pixmap = source.copy(QtCore.QRect(round(left), round(top),
+                                              round(source.width() - left - right),
+                                              round(source.height() - top - bottom)))
+            pixmap = pixmap.scaled(round(box.width), round(box.height), QtCore.Qt.IgnoreAspectRatio,
+                                   QtCore.Qt.SmoothTransformation)
+            if box.rotation:
+                pixmap = pixmap.transformed(QtGui.QTransform().rotate(box.rotation), QtCore.Qt.SmoothTransformation)
+            image_item.setPixmap(pixmap)
+            image_item.setPos(box.x, box.y)
+            image_item.pixmap_rotation = box.rotation
+            image_item.source_crop = list(box.crop)
+        for op in layout.ops:
+            self.execute_command(format_op(op))
 
     def export_commands(self):
         file_name, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Commands", "", "Text Files (*.txt)")
@@ -620,6 +740,11 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.snap_to_image(other_index=other_index, side=side)
             return
 
+        # Auto-arranged images
+        elif command_str == 'Auto-arranged images':
+            self.auto_layout()
+            return
+
         else:
             print(f"Unknown command: {command_str}")
 
@@ -0,0 +1,79 @@
+import io
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from PIL import Image
+from profiles import frame_fingerprint
+
+
+class FramePool:
+    """Preallocated RGBA frames that screenshots are decoded into.
+
+    Each frame size gets a ring of `slots` images whose pixels live in numpy
+    buffers, so a capture loop keeps writing into the same memory instead of
+    allocating a new multi-megabyte image every iteration. A frame stays
+    valid until `slots` more frames of the same size have been decoded; copy
+    it to keep it longer. Only the most recently used `max_sizes` sizes keep
+    their buffers.
+    """
+
+    def __init__(self, slots=2, max_sizes=3):
+        self.slots = slots
+        self.max_sizes = max_sizes
+        self.rings = OrderedDict()  # (width, height) -> [[(buffer, image)], next slot]
+
+    def frame(self, size):
+        """Next free (buffer, image) pair for `size`; the image maps the buffer's memory."""
+        if size in self.rings:
+            self.rings.move_to_end(size)
+        else:
+            frames = []
+            for _ in range(self.slots):
+                buffer = np.full((size[1], size[0], 4), 255, dtype=np.uint8)
+                image = Image.frombuffer("RGBA", size, buffer, "raw", "RGBA", 0, 1)
+                # Mapped images are read-only by default, and writing to one would
+                # copy it; the pool owns the buffer, so let paste write in place
+                image.readonly = 0
+                frames.append((buffer, image))
+            self.rings[size] = [frames, 0]
+            while len(self.rings) > self.max_sizes:
+                self.rings.popitem(last=False)
+        ring = self.rings[size]
+        frame = ring[0][ring[1]]
+        ring[1] = (ring[1] + 1) % self.slots
+        return frame
+
+    def buffer(self, size):
+        """Next free buffer for a frame of `size`, shaped (height, width, 4)."""
+        return self.frame(size)[0]
+
+    def decode(self, data):
+        """Decode encoded image bytes into a pooled frame and return its image."""
+        with Image.open(io.BytesIO(data)) as decoded:
+            decoded.load()
+            _, image = self.frame(decoded.size)
+            # OBS sends RGBA, which is copied straight into the pooled memory
+            image.paste(decoded if decoded.mode in ("RGB", "RGBA") else decoded.convert("RGBA"))
+        return image
+
+    def allocated_bytes(self):
+        return sum(buffer.nbytes for frames, _ in self.rings.values() for buffer, _ in frames)
+
+
+class FingerprintHistory:
+    """The last `maxlen` frame fingerprints with the time they were taken."""
+
+    def __init__(self, maxlen=512):
+        self.entries = deque(maxlen=maxlen)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, frame, timestamp=None):
+        """Fingerprint a (low resolution) frame and remember it."""
+        fingerprint = frame_fingerprint(frame)
+        self.entries.append((time.time() if timestamp is None else timestamp, fingerprint))
+        return fingerprint
+
+    def latest(self):
+        return self.entries[-1][1] if self.entries else None
@@ -0,0 +1,162 @@
+import numpy as np
+
+# One record per box. x/y is the top-left of the box's bounding box on its
+# canvas, w/h its size before rotation, rot the clockwise rotation in degrees
+# and crop_* the insets into the source image in source pixels.
+BOX_DTYPE = np.dtype([
+    ('x', 'f8'), ('y', 'f8'), ('w', 'f8'), ('h', 'f8'), ('rot', 'f8'),
+    ('crop_l', 'f8'), ('crop_t', 'f8'), ('crop_r', 'f8'), ('crop_b', 'f8'),
+])
+
+SIDES = ('left', 'right', 'top', 'bottom')
+
+
+def empty(count):
+    return np.zeros(count, dtype=BOX_DTYPE)
+
+
+def from_layout(layout):
+    """Box records for every box of a layout_format.Layout."""
+    boxes = empty(len(layout.boxes))
+    for i, box in enumerate(layout.boxes):
+        boxes[i] = (box.x, box.y, box.width, box.height, box.rotation, *box.crop)
+    return boxes
+
+
+def bounding_size(boxes):
+    """Width and height of each box after rotation."""
+    radians = np.deg2rad(boxes['rot'])
+    cos, sin = np.abs(np.cos(radians)), np.abs(np.sin(radians))
+    # Snap exact quarter turns so 90 degree boxes swap sides without float noise
+    cos = np.where(cos < 1e-9, 0.0, cos)
+    sin = np.where(sin < 1e-9, 0.0, sin)
+    return boxes['w'] * cos + boxes['h'] * sin, boxes['w'] * sin + boxes['h'] * cos
+
+
+def centres(boxes):
+    width, height = bounding_size(boxes)
+    return boxes['x'] + width / 2, boxes['y'] + height / 2
+
+
+def _select(boxes, mask):
+    return np.ones(len(boxes), dtype=bool) if mask is None else np.asarray(mask)
+
+
+def center(boxes, canvas_size, horizontal=True, vertical=True, mask=None):
+    """Centre the selected boxes on the canvas along one or both axes."""
+    boxes = boxes.copy()
+    selected = _select(boxes, mask)
+    width, height = bounding_size(boxes)
+    if horizontal:
+        boxes['x'] = np.where(selected, (canvas_size[0] - width) / 2, boxes['x'])
+    if vertical:
+        boxes['y'] = np.where(selected, (canvas_size[1] - height) / 2, boxes['y'])
+    return boxes
+
+
+def snap_to_canvas(boxes, canvas_size, side, mask=None):
+    """Move the selected boxes against one side of the canvas."""
+    boxes = boxes.copy()
+    selected = _select(boxes, mask)
+    width, height = bounding_size(boxes)
+    if side == 'left':
+        boxes['x'] = np.where(selected, 0, boxes['x'])
+    elif side == 'right':
+        boxes['x'] = np.where(selected, canvas_size[0] - width, boxes['x'])
+    elif side == 'top':
+        boxes['y'] = np.where(selected, 0, boxes['y'])
+    elif side == 'bottom':
+        boxes['y'] = np.where(selected, canvas_size[1] - height, boxes['y'])
+    else:
+        raise ValueError(f"Invalid side '{side}'")
+    return boxes
+
+
+def snap_to_box(boxes, index, other_index, side):
+    """Place box `index` against `side` of box `other_index`, aligned to its corner."""
+    boxes = boxes.copy()
+    width, height = bounding_size(boxes)
+    other = boxes[other_index]
+    if side == 'right':
+        x, y = other['x'] + width[other_index], other['y']
+    elif side == 'left':
+        x, y = other['x'] - width[index], other['y']
+    elif side == 'top':
+        x, y = other['x'], other['y'] - height[index]
+    elif side == 'bottom':
+        x, y = other['x'], other['y'] + height[other_index]
+    else:
+        raise ValueError(f"Invalid side '{side}'")
+    boxes['x'][index] = x
+    boxes['y'][index] = y
+    return boxes
+
+
+def affine(boxes, matrix):
+    """Apply a 2x3 scale-and-translate matrix to every box at once.
+
+    Positions go through the full matrix; sizes are scaled by its diagonal,
+    so the matrix must not shear or rotate.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    boxes = boxes.copy()
+    x, y = boxes['x'].copy(), boxes['y'].copy()
+    boxes['x'] = matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2]
+    boxes['y'] = matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2]
+    # Sizes are measured before rotation, so quarter-turned boxes swap scales
+    quarter = np.round(boxes['rot'] / 90) % 2 == 1
+    boxes['w'] *= np.where(quarter, matrix[1, 1], matrix[0, 0])
+    boxes['h'] *= np.where(quarter, matrix[0, 0], matrix[1, 1])
+    return boxes
+
+
+def canvas_matrix(from_size, to_size):
+    """Matrix mapping one canvas onto another, e.g. the 800x450 preview onto OBS."""
+    return [[to_size[0] / from_size[0], 0, 0], [0, to_size[1] / from_size[1], 0]]
+
+
+def to_obs_transforms(boxes, source_sizes, from_size, to_size):
+    """SceneItemTransform dicts for all boxes, mapped onto an OBS canvas.
+
+    `source_sizes` holds the (width, height) of each box's source. Items use
+    centre alignment, so the position is the box centre on the OBS canvas
+    and OBS can rotate around it without moving the box.
+    """
+    mapped = affine(boxes, canvas_matrix(from_size, to_size))
+    source_sizes = np.asarray(source_sizes, dtype=np.float64).reshape(-1, 2)
+    # OBS only takes whole-pixel crops, so the scale is worked out from the
+    # rounded crop; otherwise the shown size drifts from the layout
+    crops = np.round(np.stack([mapped['crop_l'], mapped['crop_r'],
+                               mapped['crop_t'], mapped['crop_b']], axis=1)).astype(int)
+    shown_width = source_sizes[:, 0] - crops[:, 0] - crops[:, 1]
+    shown_height = source_sizes[:, 1] - crops[:, 2] - crops[:, 3]
+    scale_x = mapped['w'] / np.maximum(shown_width, 1)
+    scale_y = mapped['h'] / np.maximum(shown_height, 1)
+    centre_x, centre_y = centres(mapped)
+
+    transforms = []
+    for i in range(len(mapped)):
+        transforms.append({
+            "positionX": float(centre_x[i]),
+            "positionY": float(centre_y[i]),
+            "rotation": float(mapped['rot'][i]),
+            "scaleX": float(scale_x[i]),
+            "scaleY": float(scale_y[i]),
+            "cropLeft": int(crops[i, 0]),
+            "cropRight": int(crops[i, 1]),
+            "cropTop": int(crops[i, 2]),
+            "cropBottom": int(crops[i, 3]),
+            "alignment": 0
+        })
+    return transforms
+
+
+def union_bounds(rects):
+    """Bounding [left, top, right, bottom] of an (N, 4) array of rectangles."""
+    rects = np.asarray(rects)
+    return [rects[:, 0].min(), rects[:, 1].min(), rects[:, 2].max(), rects[:, 3].max()]
+
+
+def inset(rects, distance):
+    """Move every edge of an (N, 4) array of rectangles inward by `distance`."""
+    return np.asarray(rects) + np.array([1, 1, -1, -1]) * distance
@@ -0,0 +1,269 @@
+import re
+import struct
+import sys
+
+# File layout (all little-endian):
+#   header   magic, version, box count, name table size, canvas width/height
+#   records  one fixed-size record per box with its final state
+#   names    UTF-8 image paths, each prefixed with its length
+#   op log   optional fixed-size edit operations appended after the snapshot
+MAGIC = b"RBLY"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIff")
+BOX_RECORD = struct.Struct("<H9f")
+OP_RECORD = struct.Struct("<BBHff")
+
+# Operation codes for the append-only log
+OP_SELECT = 1
+OP_ROTATE = 2
+OP_SCALE_FIT = 3
+OP_SCALE_FACTOR = 4
+OP_SET_DIMENSIONS = 5
+OP_SCALE_DOWN = 6
+OP_CROP = 7
+OP_RESET_CROP = 8
+OP_MOVE = 9
+OP_CENTER = 10
+OP_SNAP_CANVAS = 11
+OP_SNAP_IMAGE = 12
+OP_AUTO_LAYOUT = 13
+
+SIDES = ['left', 'right', 'top', 'bottom']
+CENTER_BOTH, CENTER_HORIZONTAL, CENTER_VERTICAL = 0, 1, 2
+
+
+class LayoutBox:
+    """Final state of one box on the 16:9 canvas.
+
+    `crop` holds the left, top, right and bottom insets in source image
+    pixels. The cropped source is scaled to `width` x `height`, rotated by
+    `rotation` degrees clockwise and its bounding box placed at (x, y).
+    A box with no size has not been placed yet and keeps its initial state.
+    """
+
+    def __init__(self, path, x=0.0, y=0.0, width=0.0, height=0.0, rotation=0.0, crop=(0, 0, 0, 0)):
+        self.path = path
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+        self.crop = tuple(crop)
+
+    def __repr__(self):
+        return (f"LayoutBox({self.path!r}, x={self.x:.1f}, y={self.y:.1f}, "
+                f"size={self.width:.1f}x{self.height:.1f}, rotation={self.rotation:g}, crop={self.crop})")
+
+    @property
+    def placed(self):
+        return self.width > 0 and self.height > 0
+
+
+class Layout:
+    """A versioned snapshot of every box plus an optional op log."""
+
+    def __init__(self, boxes=None, canvas_size=(800, 450), ops=None, pending_ops=None):
+        self.boxes = boxes or []
+        self.canvas_size = canvas_size
+        self.ops = ops or []
+        # Ops logged after the snapshot, counted even when they were not decoded
+        self.pending_ops = len(self.ops) if pending_ops is None else pending_ops
+
+    def to_bytes(self, include_ops=True):
+        names = b"".join(struct.pack("<H", len(encoded)) + encoded
+                         for encoded in (box.path.encode('utf-8') for box in self.boxes))
+        parts = [HEADER.pack(MAGIC, VERSION, len(self.boxes), len(names), *self.canvas_size)]
+        for index, box in enumerate(self.boxes):
+            parts.append(BOX_RECORD.pack(index, box.x, box.y, box.width, box.height,
+                                         box.rotation, *box.crop))
+        parts.append(names)
+        if include_ops:
+            parts.extend(OP_RECORD.pack(*op) for op in self.ops)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, include_ops=False):
+        """Decode a snapshot, and its op log only if `include_ops` is set."""
+        count, names_size, canvas_size = read_header(data)
+        offset = HEADER.size
+        records = [BOX_RECORD.unpack_from(data, offset + i * BOX_RECORD.size) for i in range(count)]
+        offset += count * BOX_RECORD.size
+        paths = []
+        names_end = offset + names_size
+        while offset < names_end:
+            (length,) = struct.unpack_from("<H", data, offset)
+            paths.append(data[offset + 2:offset + 2 + length].decode('utf-8'))
+            offset += 2 + length
+
+        boxes = []
+        for index, x, y, width, height, rotation, *crop in records:
+            boxes.append(LayoutBox(paths[index], x, y, width, height, rotation, crop))
+        ops = list(iter_ops(data[names_end:])) if include_ops else []
+        pending_ops = len(ops) if include_ops else (len(data) - names_end) // OP_RECORD.size
+        return cls(boxes, canvas_size, ops, pending_ops)
+
+
+def read_header(data):
+    """Box count, name table size and canvas size from the start of a layout."""
+    magic, version, count, names_size, canvas_width, canvas_height = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a layout file")
+    if version > VERSION:
+        raise ValueError(f"Layout version {version} is newer than supported version {VERSION}")
+    return count, names_size, (canvas_width, canvas_height)
+
+
+def load_layout(path, include_ops=False):
+    """Load the snapshot of a layout file; its cost depends on the box count, not the op log.
+
+    Only the header, records and name table are read. The ops logged after
+    the snapshot are counted in `pending_ops` and streamed in with
+    stream_ops only if `include_ops` is set.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        count, names_size, _ = read_header(header)
+        data = header + f.read(count * BOX_RECORD.size + names_size)
+        log_size = f.seek(0, 2) - len(data)
+    layout = Layout.from_bytes(data)
+    layout.pending_ops = log_size // OP_RECORD.size
+    if include_ops:
+        layout.ops = list(stream_ops(path))
+    return layout
+
+
+def save_layout(path, layout):
+    """Write a compacted layout: the snapshot followed by its pending ops."""
+    with open(path, 'wb') as f:
+        f.write(layout.to_bytes())
+
+
+def append_op(path, op):
+    """Append one operation to the log of an existing layout file."""
+    with open(path, 'ab') as f:
+        f.write(OP_RECORD.pack(*op))
+
+
+def iter_ops(data):
+    """Stream operations out of a bytes-like op log."""
+    for offset in range(0, len(data) - OP_RECORD.size + 1, OP_RECORD.size):
+        yield OP_RECORD.unpack_from(data, offset)
+
+
+def stream_ops(path):
+    """Stream the op log of a layout file without loading it whole."""
+    with open(path, 'rb') as f:
+        count, names_size, _ = read_header(f.read(HEADER.size))
+        f.seek(count * BOX_RECORD.size + names_size, 1)
+        while True:
+            chunk = f.read(OP_RECORD.size)
+            if len(chunk) < OP_RECORD.size:
+                return
+            yield OP_RECORD.unpack(chunk)
+
+
+# Text commands written by format.py's "Export Commands"; image numbers are 1-based
+COMMAND_PATTERNS = [
+    (r'Selected Image (\d+)', lambda m: (OP_SELECT, 0, 0, 0)),
+    (r'Rotated Image (\d+) by (-?\d+) degrees', lambda m: (OP_ROTATE, 0, float(m.group(2)), 0)),
+    (r'Scaled Image (\d+) to fit scene height', lambda m: (OP_SCALE_FIT, 1, 0, 0)),
+    (r'Scaled Image (\d+) to fit scene width', lambda m: (OP_SCALE_FIT, 0, 0, 0)),
+    (r'Scaled Image (\d+) by factor ([\d\.]+)', lambda m: (OP_SCALE_FACTOR, 0, float(m.group(2)), 0)),
+    (r'Set dimensions of Image (\d+) to (\d+)x(\d+)',
+     lambda m: (OP_SET_DIMENSIONS, 0, float(m.group(2)), float(m.group(3)))),
+    (r'Scaled down Image (\d+) by (\d+)%', lambda m: (OP_SCALE_DOWN, 0, float(m.group(2)), 0)),
+    (r'Cropped (?P<amount>\d+)px from (?P<side>\w+) of Image (?P<image>\d+)',
+     lambda m: (OP_CROP, SIDES.index(m.group('side')), float(m.group('amount')), 0)),
+    (r'Reset crop of Image (\d+)', lambda m: (OP_RESET_CROP, 0, 0, 0)),
+    (r'Moved Image (\d+) by \((-?\d+), (-?\d+)\)',
+     lambda m: (OP_MOVE, 0, float(m.group(2)), float(m.group(3)))),
+    (r'Centered Image (\d+)', lambda m: (OP_CENTER, CENTER_BOTH, 0, 0)),
+    (r'Centered Image (\d+) horizontally', lambda m: (OP_CENTER, CENTER_HORIZONTAL, 0, 0)),
+    (r'Centered Image (\d+) vertically', lambda m: (OP_CENTER, CENTER_VERTICAL, 0, 0)),
+    (r'Snapped Image (\d+) to canvas (left|right|top|bottom)',
+     lambda m: (OP_SNAP_CANVAS, SIDES.index(m.group(2)), 0, 0)),
+    (r'Snapped Image (\d+) to (left|right|top|bottom) of Image (\d+)',
+     lambda m: (OP_SNAP_IMAGE, SIDES.index(m.group(2)), float(int(m.group(3)) - 1), 0)),
+    (r'Auto-arranged images', lambda m: (OP_AUTO_LAYOUT, 0, 0, 0)),
+]
+COMMAND_PATTERNS = [(re.compile(pattern + '$'), build) for pattern, build in COMMAND_PATTERNS]
+
+
+def parse_command(command_str):
+    """Turn one text command into an op tuple, or None if it is not recognised."""
+    for pattern, build in COMMAND_PATTERNS:
+        m = pattern.match(command_str.strip())
+        if m:
+            if 'image' in pattern.groupindex:
+                number = m.group('image')
+            else:
+                number = m.group(1) if pattern.groups else 1
+            opcode, flag, a, b = build(m)
+            return (opcode, flag, int(number) - 1, a, b)
+    return None
+
+
+def format_op(op):
+    """Turn an op tuple back into the text command format.py shows."""
+    opcode, flag, index, a, b = op
+    image = f"Image {index + 1}"
+    if opcode == OP_SELECT:
+        return f"Selected {image}"
+    if opcode == OP_ROTATE:
+        return f"Rotated {image} by {a:g} degrees"
+    if opcode == OP_SCALE_FIT:
+        return f"Scaled {image} to fit scene {'height' if flag else 'width'}"
+    if opcode == OP_SCALE_FACTOR:
+        return f"Scaled {image} by factor {round(a, 4)}"
+    if opcode == OP_SET_DIMENSIONS:
+        return f"Set dimensions of {image} to {int(a)}x{int(b)}"
+    if opcode == OP_SCALE_DOWN:
+        return f"Scaled down {image} by {int(a)}%"
+    if opcode == OP_CROP:
+        return f"Cropped {int(a)}px from {SIDES[flag]} of {image}"
+    if opcode == OP_RESET_CROP:
+        return f"Reset crop of {image}"
+    if opcode == OP_MOVE:
+        return f"Moved {image} by ({int(a)}, {int(b)})"
+    if opcode == OP_CENTER:
+        return f"Centered {image}" + ["", " horizontally", " vertically"][flag]
+    if opcode == OP_SNAP_CANVAS:
+        return f"Snapped {image} to canvas {SIDES[flag]}"
+    if opcode == OP_SNAP_IMAGE:
+        return f"Snapped {image} to {SIDES[flag]} of Image {int(a) + 1}"
+    if opcode == OP_AUTO_LAYOUT:
+        return "Auto-arranged images"
+    raise ValueError(f"Unknown op code {opcode}")
+
+
+def convert_commands(text_path, layout_path, image_paths=()):
+    """Convert a text command file into a layout file holding only an op log.
+
+    The snapshot is filled in (and the log compacted) the next time the
+    layout is opened and exported from format.py.
+    """
+    ops = []
+    with open(text_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            op = parse_command(line)
+            if op is None:
+                print(f"Skipping unknown command on line {line_number}: {line.strip()}")
+                continue
+            ops.append(op)
+    layout = Layout([LayoutBox(path) for path in image_paths], ops=ops)
+    save_layout(layout_path, layout)
+    print(f"Converted {len(ops)} commands from {text_path} to {layout_path}")
+    return layout
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python layout_format.py COMMANDS.txt LAYOUT.rbl [IMAGE ...]")
+        return
+    convert_commands(sys.argv[1], sys.argv[2], sys.argv[3:])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import tracemalloc
+from contextlib import redirect_stdout
+import numpy as np
+from PIL import Image, ImageDraw
+from apply import RekordboxTransformAutomator
+from profiles import ProfileStore
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+SCENE_NAME = "DJing"
+CAPTURE_NAMES = ["Rekordbox Capture"] + [f"Rekordbox Capture {i}" for i in range(1, 5)]
+NATIVE_SIZE = (1920, 1080)
+
+
+def synthetic_frame(size, variant):
+    """A Rekordbox-like capture; the two variants have different layouts."""
+    width, height = NATIVE_SIZE
+    image = Image.new("RGB", NATIVE_SIZE, (12, 12, 12))
+    draw = ImageDraw.Draw(image)
+    decks = [(40, 120, 940, 520), (980, 120, 1880, 520)]
+    strips = [(40, 560, 1880, 640), (40, 660, 1880, 740)]
+    if variant:
+        decks = [(40, 560, 940, 960), (980, 560, 1880, 960)]
+        strips = [(40, 40, 1880, 120), (40, 140, 1880, 220)]
+    for box in decks:
+        draw.rectangle(box, fill=(32, 32, 36), outline=(70, 70, 70))
+    # Waveform-like noise keeps the PNG about as large as a real capture
+    rng = np.random.default_rng(variant)
+    pixels = np.asarray(image).copy()
+    for left, top, right, bottom in strips:
+        pixels[top:bottom, left:right] = rng.integers(0, 120, (bottom - top, right - left, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels)
+    if size != (width, height):
+        image = image.resize(size, Image.BILINEAR)
+    encoded = io.BytesIO()
+    image.save(encoded, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(encoded.getvalue()).decode("ascii")
+
+
+class MockObsServer(threading.Thread):
+    """Just enough of obs-websocket v5 for apply.py's capture and watch loop.
+
+    Screenshots are pre-encoded per size and layout variant, so the server
+    itself does not add to the memory being measured.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        self.variant = 0
+        self.screenshots = {}
+        self.transforms = {}
+
+    def run(self):
+        while True:
+            connection, _ = self.listener.accept()
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def prepare(self, sizes):
+        """Encode the screenshots of both layouts up front, before measuring starts."""
+        for variant in (0, 1):
+            for size in sizes:
+                self.screenshots[(size, variant)] = synthetic_frame(size, variant)
+
+    def screenshot(self, size):
+        key = (size, self.variant)
+        if key not in self.screenshots:
+            self.screenshots[key] = synthetic_frame(size, self.variant)
+        return self.screenshots[key]
+
+    def respond(self, request_type, data):
+        if request_type == "GetInputList":
+            return {"inputs": [{"inputName": name} for name in CAPTURE_NAMES]}
+        if request_type == "GetSourceScreenshot":
+            return {"imageData": self.screenshot((data["imageWidth"], data["imageHeight"]))}
+        if request_type == "GetVideoSettings":
+            return {"baseWidth": 1920, "baseHeight": 1080}
+        if request_type == "GetSceneItemList":
+            return {"sceneItems": [{"sceneItemId": i + 1, "sceneItemIndex": i, "sourceName": name}
+                                   for i, name in enumerate(CAPTURE_NAMES)]}
+        if request_type == "GetSceneItemTransform":
+            transform = dict(self.transforms.get(data["sceneItemId"], {}))
+            transform.update(sourceWidth=NATIVE_SIZE[0], sourceHeight=NATIVE_SIZE[1])
+            return {"sceneItemTransform": transform}
+        if request_type == "SetSceneItemTransform":
+            self.transforms[data["sceneItemId"]] = data["sceneItemTransform"]
+        return {}
+
+    def serve(self, connection):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            request += connection.recv(4096)
+        key = next(line.split(":", 1)[1].strip() for line in request.decode().split("\r\n")
+                   if line.lower().startswith("sec-websocket-key"))
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        connection.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                            f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        send_frame(connection, {"op": 0, "d": {"obsWebSocketVersion": "5.0.0", "rpcVersion": 1}})
+        try:
+            while True:
+                message = recv_frame(connection)
+                if message is None:
+                    break
+                if message["op"] == 1:
+                    send_frame(connection, {"op": 2, "d": {"negotiatedRpcVersion": 1}})
+                elif message["op"] == 6:
+                    d = message["d"]
+                    send_frame(connection, {"op": 7, "d": {
+                        "requestType": d["requestType"], "requestId": d["requestId"],
+                        "requestStatus": {"result": True, "code": 100},
+                        "responseData": self.respond(d["requestType"], d.get("requestData", {}))}})
+                elif message["op"] == 8:
+                    d = message["d"]
+                    results = [{"requestType": r["requestType"],
+                                "requestStatus": {"result": True, "code": 100},
+                                "responseData": self.respond(r["requestType"], r.get("requestData", {}))}
+                               for r in d["requests"]]
+                    send_frame(connection, {"op": 9, "d": {"requestId": d["requestId"], "results": results}})
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+
+def recv_exactly(connection, count):
+    data = b""
+    while len(data) < count:
+        chunk = connection.recv(count - len(data))
+        if not chunk:
+            raise OSError("Connection closed")
+        data += chunk
+    return data
+
+
+def recv_frame(connection):
+    """Read one masked client text frame; None on a close frame."""
+    first, second = recv_exactly(connection, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(recv_exactly(connection, 2), "big")
+    elif length == 127:
+        length = int.from_bytes(recv_exactly(connection, 8), "big")
+    mask = np.frombuffer(recv_exactly(connection, 4), dtype=np.uint8)
+    payload = np.frombuffer(recv_exactly(connection, length), dtype=np.uint8) ^ np.resize(mask, length)
+    if first & 0x0F == 8:
+        return None
+    return json.loads(payload.tobytes())
+
+
+def send_frame(connection, message):
+    payload = json.dumps(message).encode()
+    if len(payload) < 126:
+        header = bytes([0x81, len(payload)])
+    elif len(payload) < 1 << 16:
+        header = bytes([0x81, 126]) + len(payload).to_bytes(2, "big")
+    else:
+        header = bytes([0x81, 127]) + len(payload).to_bytes(8, "big")
+    connection.sendall(header + payload)
+
+
+def resident_bytes():
+    """Current resident set size of this process in bytes, or None if unknown.
+
+    tracemalloc only sees Python allocations, not Pillow's native image
+    memory, so RSS is what shows screenshots piling up. Falls back to the
+    peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MeasuredAutomator(RekordboxTransformAutomator):
+    """Samples traced and resident memory after every watch screenshot."""
+
+    def __init__(self, server, change_every, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+        self.change_every = change_every
+        self.captures = 0
+        self.samples = []
+        self.resident = []
+
+    def capture_frame(self, size):
+        frame = super().capture_frame(size)
+        if size == self.watch_size:
+            self.captures += 1
+            self.samples.append(tracemalloc.get_traced_memory()[0])
+            self.resident.append(resident_bytes())
+            # Switch the Rekordbox layout now and then so setups are part of the run
+            if self.captures % self.change_every == 0:
+                self.server.variant = 1 - self.server.variant
+        return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that apply.py --watch keeps memory flat, "
+                                                 "using tracemalloc, RSS and a local mock OBS server.")
+    parser.add_argument("--iterations", type=int, default=3600,
+                        help="watch screenshots to take; 3600 is two hours at the default interval")
+    parser.add_argument("--change-every", type=int, default=600,
+                        help="screenshots between simulated Rekordbox layout changes")
+    parser.add_argument("--max-growth-kb", type=float, default=256,
+                        help="allowed growth of traced memory after the warm-up")
+    parser.add_argument("--max-resident-growth-mb", type=float, default=4,
+                        help="allowed growth of resident memory after the warm-up; the default is "
+                             "half a 1920x1080 RGBA frame, so a frame left behind per setup fails")
+    args = parser.parse_args()
+
+    server = MockObsServer()
+    server.start()
+    template_folder = os.path.abspath("selected_boxes")
+
+    with tempfile.TemporaryDirectory() as folder:
+        automator = MeasuredAutomator(server, args.change_every, port=server.port)
+        # Setup captures at 1920x1080; the server shares this process's memory
+        server.prepare([automator.watch_size, NATIVE_SIZE])
+        tracemalloc.start()
+        automator.template_folder = template_folder
+        # Keep the real profiles.json untouched
+        automator.profiles = ProfileStore(os.path.join(folder, "profiles.json")).load()
+        automator.watch_interval = 0
+        automator.verify = False
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            automator.watch(iterations=args.iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # Warm-up covers both layouts once, so every frame size and cache is in place
+    warm_up = min(len(automator.samples) - 1, 2 * args.change_every + 1)
+
+    def growth(samples):
+        baseline = max(samples[warm_up:warm_up + args.change_every])
+        final = max(samples[-args.change_every:])
+        return baseline, final, (final - baseline) / 1024
+
+    print(f"Screenshots: {len(automator.samples)}, layout changes: {len(automator.samples) // args.change_every}")
+    baseline, final, traced_growth = growth(automator.samples)
+    print(f"Traced memory after warm-up: {baseline / 1024:.0f} KiB, at the end: {final / 1024:.0f} KiB "
+          f"({traced_growth:+.0f} KiB), peak: {peak / 1024 / 1024:.1f} MiB")
+    failures = []
+    if traced_growth > args.max_growth_kb:
+        failures.append(f"traced memory grew by more than {args.max_growth_kb:.0f} KiB")
+    if None in automator.resident:
+        print("Resident memory: not available on this platform, native image memory is not checked")
+    else:
+        baseline, final, resident_growth = growth(automator.resident)
+        print(f"Resident memory after warm-up: {baseline / 1024 / 1024:.1f} MiB, "
+              f"at the end: {final / 1024 / 1024:.1f} MiB ({resident_growth:+.0f} KiB)")
+        if resident_growth > args.max_resident_growth_mb * 1024:
+            failures.append(f"resident memory grew by more than {args.max_resident_growth_mb:g} MiB")
+    print(f"Frame pool: {automator.frames.allocated_bytes() / 1024 / 1024:.1f} MiB, "
+          f"fingerprint history: {len(automator.history)} entries")
+    if failures:
+        print(f"FAIL: {', '.join(failures)}")
+        sys.exit(1)
+    print("OK: memory stayed flat")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import base64
+import hashlib
+import json
+import websocket
+
+
+class ObsBatchSession:
+    """Send obs-websocket v5 request batches over a dedicated connection.
+
+    obs-websocket-py only understands single requests, so batches use their
+    own socket. Requests are the usual `obswebsocket.requests` objects, which
+    keeps call sites identical to `ws.call(...)`.
+    """
+
+    def __init__(self, host="localhost", port=4455, password=None, timeout=30):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.ws = None
+        self.batch_id = 0
+
+    def connect(self):
+        """Open the socket and complete the v5 Hello/Identify handshake."""
+        self.ws = websocket.WebSocket()
+        self.ws.settimeout(self.timeout)
+        self.ws.connect(f"ws://{self.host}:{self.port}")
+        hello = json.loads(self.ws.recv())
+        if hello.get('op') != 0:
+            raise ConnectionError(f"Unexpected handshake message: {hello}")
+
+        identify = {'rpcVersion': 1, 'eventSubscriptions': 0}
+        auth = hello['d'].get('authentication')
+        if auth:
+            if not self.password:
+                raise ConnectionError("OBS requires a password")
+            secret = base64.b64encode(hashlib.sha256(
+                (self.password + auth['salt']).encode('utf-8')).digest())
+            identify['authentication'] = base64.b64encode(hashlib.sha256(
+                secret + auth['challenge'].encode('utf-8')).digest()).decode('utf-8')
+        self.ws.send(json.dumps({'op': 1, 'd': identify}))
+
+        identified = json.loads(self.ws.recv())
+        if identified.get('op') != 2:
+            raise ConnectionError(f"OBS refused identification: {identified}")
+
+    def disconnect(self):
+        if self.ws:
+            self.ws.close()
+            self.ws = None
+
+    def call_batch(self, batch_requests, halt_on_failure=False):
+        """Run requests in one RequestBatch and return their results in order.
+
+        Each result is a dict with 'requestType', 'requestStatus' and,
+        when OBS sent one, 'responseData'.
+        """
+        if not batch_requests:
+            return []
+        self.batch_id += 1
+        request_id = f"batch-{self.batch_id}"
+        self.ws.send(json.dumps({
+            'op': 8,
+            'd': {
+                'requestId': request_id,
+                'haltOnFailure': halt_on_failure,
+                'executionType': 0,  # SerialRealtime
+                'requests': [{'requestType': request.name, 'requestData': request.data()}
+                             for request in batch_requests]
+            }
+        }))
+
+        # Events are not subscribed to, so only responses should arrive
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get('op') == 9 and message['d'].get('requestId') == request_id:
+                return message['d'].get('results', [])
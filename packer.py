@@ -0,0 +1,224 @@
+import geometry
+from layout_format import Layout, LayoutBox
+
+# Boxes at least this many times wider than tall are treated as waveforms
+WAVEFORM_ASPECT = 4.0
+# Two boxes whose areas are within this ratio are treated as a pair of decks
+DECK_AREA_RATIO = 0.7
+# Full-width strips may use at most this share of the canvas height
+MAX_STRIP_SHARE = 0.5
+
+
+class Unit:
+    """One rectangle for the packer: a single box or a row of boxes."""
+
+    def __init__(self, members, widths, height, rotatable):
+        self.members = members  # Box indices, left to right
+        self.widths = widths  # Member widths at scale 1, all sharing `height`
+        self.height = height
+        self.width = sum(widths)
+        self.rotatable = rotatable
+
+
+class Skyline:
+    """Bottom-left skyline over a strip of fixed width.
+
+    The skyline is a list of [x, y, width] segments covering the strip, where
+    y is the lowest free height above that segment.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.segments = [[0.0, 0.0, width]]
+
+    def find(self, width, height):
+        """Lowest (top, x, y) position for a rectangle, or None if it is too wide."""
+        best = None
+        for start in range(len(self.segments)):
+            x = self.segments[start][0]
+            if x + width > self.width + 1e-9:
+                break
+            y, end = 0.0, start
+            while end < len(self.segments) and self.segments[end][0] < x + width - 1e-9:
+                y = max(y, self.segments[end][1])
+                end += 1
+            if best is None or (y + height, x) < best[:2]:
+                best = (y + height, x, y)
+        return best
+
+    def place(self, x, width, top):
+        right = x + width
+        segments = []
+        for sx, sy, sw in self.segments:
+            # Keep the parts of existing segments outside [x, right)
+            if sx < x:
+                segments.append([sx, sy, min(sw, x - sx)])
+            if sx + sw > right:
+                start = max(sx, right)
+                segments.append([start, sy, sx + sw - start])
+        segments.append([x, top, width])
+        segments.sort()
+        merged = [segments[0]]
+        for segment in segments[1:]:
+            if abs(segment[1] - merged[-1][1]) < 1e-9:
+                merged[-1][2] += segment[2]
+            else:
+                merged.append(segment)
+        self.segments = merged
+
+
+def skyline_pack(units, scale, width, height):
+    """Place units at `scale` in a width x height area; None if they do not fit.
+
+    Each unit is tried in every allowed orientation and put wherever its top
+    ends up lowest. Returns (x, y, rotated) per unit.
+    """
+    skyline = Skyline(width)
+    placements = []
+    for unit in units:
+        unit_width, unit_height = unit.width * scale, unit.height * scale
+        options = [(unit_width, unit_height, False)]
+        if unit.rotatable:
+            options.append((unit_height, unit_width, True))
+        best = None
+        for option_width, option_height, rotated in options:
+            found = skyline.find(option_width, option_height)
+            if found and (best is None or found[:2] < best[0][:2]):
+                best = (found, option_width, rotated)
+        if best is None or best[0][0] > height + 1e-6:
+            return None
+        (top, x, y), option_width, rotated = best
+        skyline.place(x, option_width, top)
+        placements.append((x, y, rotated))
+    return placements
+
+
+# Packing orders tried in turn; the best scale over all of them wins
+ORDERS = [
+    lambda unit: -max(unit.width, unit.height),
+    lambda unit: -unit.height,
+    lambda unit: -unit.width,
+    lambda unit: -unit.width * unit.height,
+]
+
+
+def best_scale(units, width, height, iterations=30):
+    """Largest common scale at which all units fit, with their placements."""
+    if not units:
+        return 1.0, [], []
+    # No unit can be scaled past the point where it alone fills the area
+    high = min(max(min(width / unit.width, height / unit.height),
+                   min(width / unit.height, height / unit.width) if unit.rotatable else 0)
+               for unit in units)
+    best = (0.0, None, None)
+    for order in ORDERS:
+        ordered = sorted(units, key=order)
+        low, upper, placements = best[0], high, None
+        if skyline_pack(ordered, low, width, height) is None:
+            continue
+        for _ in range(iterations):
+            middle = (low + upper) / 2
+            found = skyline_pack(ordered, middle, width, height)
+            if found is None:
+                upper = middle
+            else:
+                low, placements = middle, found
+        if placements is not None and low > best[0]:
+            best = (low, ordered, placements)
+    if best[1] is None:
+        # Nothing improved on the first order, so pack it at its lower bound
+        ordered = sorted(units, key=ORDERS[0])
+        return best[0], ordered, skyline_pack(ordered, best[0], width, height)
+    return best
+
+
+def guess_constraints(sizes, origins=None):
+    """Pick waveforms and a deck pair from box shapes alone.
+
+    Waveforms are the long thin boxes; the decks are the two largest of the
+    rest if their areas are close. With the (x, y) `origins` of the boxes in
+    the capture, the decks keep their left-to-right order.
+    """
+    full_width = [i for i, (w, h) in enumerate(sizes) if w >= WAVEFORM_ASPECT * h]
+    rest = sorted((i for i in range(len(sizes)) if i not in full_width),
+                  key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+    rows = []
+    if len(rest) >= 2:
+        first, second = (sizes[i][0] * sizes[i][1] for i in rest[:2])
+        if second >= DECK_AREA_RATIO * first:
+            rows.append(sorted(rest[:2], key=lambda i: origins[i] if origins else i))
+    return rows, full_width
+
+
+def pack(sizes, canvas_size=(800, 450), rows=(), full_width=(), rotate=True):
+    """Arrange boxes of the given (width, height) without overlaps.
+
+    `rows` lists groups of box indices that stay side by side at a common
+    height, left to right; `full_width` lists boxes stretched (keeping their
+    aspect ratio) across the canvas and stacked at the top. All other boxes
+    share one scale, the largest at which the skyline packer fits them below
+    the strips, and may be rotated by 90 degrees. Returns geometry box records
+    in the order of `sizes`.
+    """
+    canvas_width, canvas_height = canvas_size
+    boxes = geometry.empty(len(sizes))
+
+    # Full-width strips first; scaled down together if they would crowd out the rest
+    strip_heights = [sizes[i][1] * canvas_width / sizes[i][0] for i in full_width]
+    strip_scale = min(1.0, MAX_STRIP_SHARE * canvas_height / sum(strip_heights)) if full_width else 1.0
+    y = 0.0
+    for i, strip_height in zip(full_width, strip_heights):
+        width, height = canvas_width * strip_scale, strip_height * strip_scale
+        boxes[i] = ((canvas_width - width) / 2, y, width, height, 0, 0, 0, 0, 0)
+        y += height
+    area_top = y
+    area_height = canvas_height - area_top
+
+    units = []
+    grouped = set(full_width)
+    for row in rows:
+        row = [i for i in row if i not in grouped]
+        if not row:
+            continue
+        height = sizes[row[0]][1]
+        units.append(Unit(row, [sizes[i][0] * height / sizes[i][1] for i in row], height, False))
+        grouped.update(row)
+    for i in range(len(sizes)):
+        if i not in grouped:
+            units.append(Unit([i], [sizes[i][0]], sizes[i][1], rotate))
+
+    scale, ordered, placements = best_scale(units, canvas_width, area_height)
+    if not ordered or placements is None:
+        return boxes
+
+    # Centre the packed block in the area below the strips
+    extents = []
+    for unit, (x, y, rotated) in zip(ordered, placements):
+        width, height = unit.width * scale, unit.height * scale
+        if rotated:
+            width, height = height, width
+        extents.append((x + width, y + height))
+    offset_x = (canvas_width - max(right for right, _ in extents)) / 2
+    offset_y = area_top + (area_height - max(bottom for _, bottom in extents)) / 2
+
+    for unit, (x, y, rotated) in zip(ordered, placements):
+        height = unit.height * scale
+        for i, member_width in zip(unit.members, unit.widths):
+            width = member_width * scale
+            boxes[i] = (x + offset_x, y + offset_y, width, height, 90 if rotated else 0, 0, 0, 0, 0)
+            x += width
+    return boxes
+
+
+def pack_layout(paths, sizes, canvas_size=(800, 450), rows=None, full_width=None, origins=None):
+    """Auto-arranged layout_format.Layout for boxes of the given source sizes.
+
+    Constraints that are not given are guessed with guess_constraints.
+    """
+    if rows is None or full_width is None:
+        guessed_rows, guessed_full_width = guess_constraints(sizes, origins)
+        rows = guessed_rows if rows is None else rows
+        full_width = guessed_full_width if full_width is None else full_width
+    boxes = pack(sizes, canvas_size, rows, full_width)
+    return Layout([LayoutBox(path, *(float(box[field]) for field in ('x', 'y', 'w', 'h', 'rot')))
+                   for path, box in zip(paths, boxes)], canvas_size)
@@ -0,0 +1,239 @@
+import argparse
+import os
+import time
+from PIL import Image
+from apply import RekordboxTransformAutomator
+from profiles import frame_fingerprint
+from segmentation import DEFAULT_TOLERANCE, METRICS, BoxDetector
+from template_index import TemplateIndex
+
+
+class SetupPipeline:
+    """Screenshot -> detect -> layout -> apply in a single process.
+
+    Every stage hands its results to the next one in memory: the decoded
+    frame, the detector built on it and the cropped templates. Nothing is
+    written to selected_boxes/ unless asked for.
+    """
+
+    def __init__(self, automator, image_path=None, seeds=None, save_templates=False, dry_run=False,
+                 metric='rgb', tolerance=None, min_size=8, min_confidence=0.1):
+        self.automator = automator
+        self.min_size = min_size  # Pixels; smaller boxes are stray clicks or noise
+        self.min_confidence = min_confidence  # Weakest edge confidence a box may have
+        self.metric = metric
+        self.tolerance = DEFAULT_TOLERANCE[metric] if tolerance is None else tolerance
+        self.image_path = image_path
+        self.seeds = seeds or []
+        self.save_templates = save_templates
+        self.dry_run = dry_run
+        self.frame = None
+        self.fingerprint = None
+        self.regions = {}
+        self.crops = {}
+        self.timings = []
+
+    def timed(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings.append((stage, time.perf_counter() - start))
+        return result
+
+    def capture(self):
+        """Load the frame from a file or take it from OBS at native resolution."""
+        # A saved screenshot still needs OBS to apply to, unless this is a dry run
+        if not (self.image_path and self.dry_run):
+            if not self.automator.connect_obs():
+                return False
+            if self.automator.build and not self.automator.ensure_capture_input():
+                return False
+        if self.image_path:
+            self.frame = Image.open(self.image_path)
+            self.frame.load()
+        else:
+            # The native size comes from the scene item, so detection runs on real pixels
+            if not self.automator.detect_source_resolution():
+                return False
+            if not self.automator.capture_source_screenshot(self.automator.source_resolution):
+                return False
+            self.frame = self.automator.source_screenshot
+        self.automator.source_screenshot = self.frame
+        self.automator.source_resolution = self.frame.size
+        self.fingerprint = frame_fingerprint(self.frame)
+        print(f"Frame: {self.frame.width}x{self.frame.height}")
+        return True
+
+    def seed_points(self):
+        """Seeds from the command line, else region centres of the closest profile.
+
+        Regions recorded at another resolution are scaled to this frame, which
+        is what makes a re-setup after a monitor switch a single command.
+        """
+        if self.seeds:
+            return [(f"box_{x}_{y}.png", x, y) for x, y in self.seeds]
+
+        width, height = self.frame.size
+        store = self.automator.profiles
+        profile = store.find_regions(width, height, self.fingerprint)
+        if profile is None:
+            # Prefer a profile with the same aspect ratio, then any with regions
+            candidates = [p for p in store.profiles.values() if p.get('regions')]
+            candidates.sort(key=lambda p: abs(p['resolution'][0] / p['resolution'][1] - width / height))
+            profile = candidates[0] if candidates else None
+        if profile is None:
+            return []
+
+        scale_x = width / profile['resolution'][0]
+        scale_y = height / profile['resolution'][1]
+        seeds = []
+        for region in profile['regions']:
+            x = int((region['x1'] + region['x2']) / 2 * scale_x)
+            y = int((region['y1'] + region['y2']) / 2 * scale_y)
+            seeds.append((region['name'], min(x, width - 1), min(y, height - 1)))
+        return seeds
+
+    def detect(self):
+        """Find every box in the frame and crop its template in memory."""
+        seeds = self.seed_points()
+        if not seeds:
+            print("No seeds given and no profile with regions to take them from")
+            return False
+        detector = BoxDetector(self.frame, tolerance=self.tolerance, metric=self.metric)
+        boxes, confidence = detector.detect([(x, y) for _, x, y in seeds])
+        index = TemplateIndex()
+        for (name, _, _), coords, edge_confidence in zip(seeds, boxes, confidence):
+            # Such a box would be blown up to fill the canvas, so leave it out
+            if min(coords[2] - coords[0], coords[3] - coords[1]) < self.min_size:
+                print(f"Dropping {name}: {coords} is smaller than {self.min_size}px")
+                continue
+            if min(edge_confidence) < self.min_confidence:
+                print(f"Dropping {name}: {coords} has an edge that was not found "
+                      f"(edge confidence {min(edge_confidence):.2f})")
+                continue
+            # OBS frames are RGBA; templates are kept as plain RGB
+            crop = self.frame.crop(coords).convert("RGB")
+            # Two seeds inside one panel give the same box; keep the first
+            duplicate = index.duplicate_of(crop, coords, self.regions)
+            if duplicate:
+                print(f"Skipping {name}, same panel as {duplicate}")
+                continue
+            index.add(name, crop)
+            self.regions[name] = coords
+            self.crops[name] = crop
+            print(f"Detected {name}: {coords} (edge confidence {min(edge_confidence):.2f})")
+
+        if not self.regions:
+            print("No usable boxes detected, try other seeds or a different --metric/--tolerance")
+            return False
+        width, height = self.frame.size
+        for name, coords in self.regions.items():
+            self.automator.profiles.record_region(width, height, self.fingerprint, name, coords)
+        return True
+
+    def layout(self):
+        """Compute transforms from the in-memory templates."""
+        self.automator.template_images = self.crops
+        self.automator.templates = {
+            name: {'width': crop.width, 'height': crop.height,
+                   'aspect_ratio': crop.width / crop.height}
+            for name, crop in self.crops.items()
+        }
+        return self.automator.calculate_layout()
+
+    def apply(self, transforms):
+        """Send the layout to OBS and verify it."""
+        success = (self.automator.apply_layout(transforms)
+                   and self.automator.verify_layout(self.automator.cropped(transforms)))
+        if success:
+            self.automator.store_profile(transforms)
+        return success
+
+    def write_templates(self):
+        """Optionally keep the detected crops as regular template files."""
+        os.makedirs(self.automator.template_folder, exist_ok=True)
+        for name, crop in self.crops.items():
+            crop.save(os.path.join(self.automator.template_folder, name), compress_level=1)
+        print(f"Wrote {len(self.crops)} templates to {self.automator.template_folder}/")
+        # Their regions go with them, so apply.py can place the new templates
+        self.automator.profiles.save()
+
+    def run(self):
+        try:
+            if not self.timed("capture", self.capture):
+                return False
+            if not self.timed("detect", self.detect):
+                return False
+            transforms = self.timed("layout", self.layout)
+            if not transforms:
+                return False
+            if self.dry_run:
+                for name, transform in transforms.items():
+                    print(f"{name}: {transform}")
+                success = True
+            else:
+                success = self.timed("apply", self.apply, transforms)
+            if success and self.save_templates:
+                self.timed("save", self.write_templates)
+            return success
+        finally:
+            for stage, seconds in self.timings:
+                print(f"{stage:>8}: {seconds * 1000:.0f} ms")
+            self.automator.disconnect_obs()
+
+
+def parse_seed(text):
+    x, y = text.split(",")
+    return int(x), int(y)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Set up the Rekordbox overlay in one step: "
+                                                 "screenshot, detect boxes, lay them out and apply to OBS.")
+    parser.add_argument("--image", help="use a saved screenshot instead of capturing from OBS")
+    parser.add_argument("--seed", type=parse_seed, action="append",
+                        help="x,y point inside a panel to detect (repeatable); "
+                             "defaults to the regions of the closest stored profile")
+    parser.add_argument("--metric", choices=METRICS, default="rgb",
+                        help="colour distance used to grow boxes (see segmentation.BoxDetector)")
+    parser.add_argument("--tolerance", type=float,
+                        help="colour distance that ends a box; defaults to the metric's default")
+    parser.add_argument("--min-size", type=int, default=8,
+                        help="drop detected boxes narrower or shorter than this many pixels")
+    parser.add_argument("--min-confidence", type=float, default=0.1,
+                        help="drop detected boxes whose weakest edge confidence is below this")
+    parser.add_argument("--build", action="store_true",
+                        help="build the overlay from one shared capture (see apply.py --build)")
+    parser.add_argument("--window", help="Rekordbox window to create the shared capture for "
+                                          "(OBS window setting, see apply.py --window)")
+    parser.add_argument("--layout", help="place the boxes as arranged in a format.py layout (.rbl)")
+    parser.add_argument("--no-verify", action="store_true", help="skip the screenshot check after applying")
+    parser.add_argument("--save-templates", action="store_true",
+                        help="also write the detected crops to selected_boxes/")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the transforms instead of sending them to OBS")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4455)
+    args = parser.parse_args()
+
+    password = os.getenv("OBS_PASSWORD")
+    if not password and not (args.dry_run and args.image):
+        print("OBS_PASSWORD environment variable not set")
+        return
+
+    automator = RekordboxTransformAutomator(host=args.host, port=args.port,
+                                            password=password, build=args.build)
+    automator.verify = not args.no_verify
+    automator.capture_window = args.window
+    automator.layout_path = args.layout
+    pipeline = SetupPipeline(automator, image_path=args.image, seeds=args.seed,
+                             save_templates=args.save_templates, dry_run=args.dry_run,
+                             metric=args.metric, tolerance=args.tolerance,
+                             min_size=args.min_size, min_confidence=args.min_confidence)
+    if pipeline.run():
+        print("Successfully set up Rekordbox overlay")
+    else:
+        print("Failed to set up Rekordbox overlay")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import json
+import os
+from PIL import Image
+
+PROFILE_FILE = "profiles.json"
+
+
+def resolution_key(width, height):
+    """Build the index key used for a capture resolution."""
+    return f"{width}x{height}"
+
+
+def frame_fingerprint(image, hash_size=8):
+    """Compute a difference hash of a frame as a hex string.
+
+    The frame is reduced to a tiny greyscale thumbnail so the hash only
+    changes when the Rekordbox layout changes, not when the waveforms move.
+    """
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(fingerprint1, fingerprint2):
+    """Count the differing bits between two hex fingerprints."""
+    return bin(int(fingerprint1, 16) ^ int(fingerprint2, 16)).count("1")
+
+
+class ProfileStore:
+    """Layout profiles keyed by capture resolution and frame fingerprint.
+
+    Each profile keeps the template set, the regions picked in
+    rekordboxes.py and the transforms computed by apply.py, so switching
+    between monitors only needs a lookup instead of a new setup.
+    """
+
+    def __init__(self, path=PROFILE_FILE, max_distance=10):
+        self.path = path
+        self.max_distance = max_distance  # Max fingerprint bits that may differ
+        self.profiles = {}
+        self.index = {}
+
+    def load(self):
+        """Load profiles from disk and rebuild the resolution index."""
+        self.profiles = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.profiles = json.load(f).get('profiles', {})
+            except (OSError, ValueError) as e:
+                print(f"Failed to load profiles from '{self.path}': {e}")
+        self._rebuild_index()
+        return self
+
+    def save(self):
+        """Write all profiles to disk atomically."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 1, 'profiles': self.profiles}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _rebuild_index(self):
+        self.index = {}
+        for profile_id, profile in self.profiles.items():
+            key = resolution_key(*profile['resolution'])
+            self.index.setdefault(key, []).append(profile_id)
+
+    def find(self, width, height, fingerprint=None):
+        """Return the closest profile for a resolution, or None if none fits."""
+        candidates = self.index.get(resolution_key(width, height), [])
+        if not candidates:
+            return None
+        if fingerprint is None:
+            # Without a frame, the most recently added profile wins
+            return self.profiles[candidates[-1]]
+
+        best, best_distance = None, self.max_distance + 1
+        for profile_id in candidates:
+            profile = self.profiles[profile_id]
+            distance = hamming_distance(profile['fingerprint'], fingerprint)
+            if distance < best_distance:
+                best, best_distance = profile, distance
+        return best
+
+    def find_regions(self, width, height, fingerprint=None):
+        """Return the closest profile for a resolution that has regions recorded.
+
+        Profiles stored by apply.py for an unknown layout start without
+        regions, so those are skipped rather than hiding older ones.
+        """
+        profile = self.find(width, height, fingerprint)
+        if profile and profile.get('regions'):
+            return profile
+        candidates = [self.profiles[profile_id] for profile_id in self.index.get(resolution_key(width, height), [])
+                      if self.profiles[profile_id].get('regions')]
+        if not candidates:
+            return None
+        if fingerprint is None:
+            return candidates[-1]
+        # Stable min keeps the most recently added among equally close ones
+        return min(reversed(candidates), key=lambda p: hamming_distance(p['fingerprint'], fingerprint))
+
+    def put(self, width, height, fingerprint, **fields):
+        """Create or update the profile matching a resolution and fingerprint.
+
+        Keyword fields (templates, regions, transforms, ...) replace the
+        stored values; fields that are not given are kept.
+        """
+        profile = self.find(width, height, fingerprint)
+        if profile is None:
+            profile_id = f"{resolution_key(width, height)}-{fingerprint}"
+            profile = {'id': profile_id, 'resolution': [width, height],
+                       'templates': {}, 'regions': [], 'transforms': {}}
+            self.profiles[profile_id] = profile
+        profile['fingerprint'] = fingerprint
+        profile.update(fields)
+        self._rebuild_index()
+        return profile
+
+    def record_region(self, width, height, fingerprint, name, coords):
+        """Remember where a saved template box was cut from a capture."""
+        profile = self.find(width, height, fingerprint) or self.put(width, height, fingerprint)
+        left, top, right, bottom = coords
+        regions = [r for r in profile['regions'] if r.get('name') != name]
+        regions.append({'name': name, 'x1': left, 'y1': top, 'x2': right, 'y2': bottom})
+        profile['regions'] = regions
+        return profile
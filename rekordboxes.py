@@ -1,35 +1,179 @@
 import tkinter as tk
 from PIL import Image, ImageTk
 import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from geometry import inset, union_bounds
+from profiles import ProfileStore, frame_fingerprint
+from segmentation import DEFAULT_TOLERANCE, METRICS, BoxDetector
+from template_index import TemplateIndex, profile_regions
+
+class TilePyramid:
+    """Image pyramid cut into fixed-size tiles for drawing large captures.
+
+    Level 0 is the full image and every further level halves it. Tiles are
+    resampled and turned into Tk images only when they become visible, and
+    at most `max_cached_tiles` are kept. When zoomed in past 1:1, level 0 is
+    cut into smaller source tiles, so a displayed tile is never larger than
+    `tile_size` and memory follows the viewport rather than the zoom or the
+    size of the capture.
+    """
+
+    def __init__(self, image, tile_size=256, max_cached_tiles=192):
+        self.tile_size = tile_size
+        self.max_cached_tiles = max_cached_tiles
+        self.levels = [image if image.mode == "RGB" else image.convert("RGB")]
+        while max(self.levels[-1].size) > tile_size:
+            self.levels.append(self.levels[-1].reduce(2))
+        self.cache = OrderedDict()
+
+    def level_for(self, zoom):
+        """Pick the smallest level that still has enough detail for `zoom`."""
+        level = 0
+        while level + 1 < len(self.levels) and zoom <= 0.5 ** (level + 1):
+            level += 1
+        return level
+
+    def span(self, level, zoom):
+        """Level pixels covered by one tile, so it is at most `tile_size` on screen."""
+        factor = zoom * 2 ** level
+        return max(1, int(self.tile_size / max(1.0, factor)))
+
+    def visible_tiles(self, zoom, view):
+        """List the tile keys covering a view given in zoomed canvas pixels."""
+        level = self.level_for(zoom)
+        factor = zoom * 2 ** level  # Display pixels per level pixel
+        span = self.span(level, zoom)
+        width, height = self.levels[level].size
+        left, top, right, bottom = view
+        first_col = max(0, int(left / factor) // span)
+        first_row = max(0, int(top / factor) // span)
+        last_col = min((width - 1) // span, int(right / factor) // span)
+        last_row = min((height - 1) // span, int(bottom / factor) // span)
+        return [(level, col, row)
+                for row in range(first_row, last_row + 1)
+                for col in range(first_col, last_col + 1)]
+
+    def tile_bounds(self, key, zoom):
+        """Return the level-pixel box and the zoomed canvas box of a tile."""
+        level, col, row = key
+        factor = zoom * 2 ** level
+        span = self.span(level, zoom)
+        width, height = self.levels[level].size
+        left, top = col * span, row * span
+        right = min(left + span, width)
+        bottom = min(top + span, height)
+        # Rounding absolute edges keeps neighbouring tiles gap-free
+        display = [round(left * factor), round(top * factor),
+                   round(right * factor), round(bottom * factor)]
+        return [left, top, right, bottom], display
+
+    def photo(self, key, zoom):
+        """Get the Tk image for a tile at a zoom level, resampling it once."""
+        cache_key = (key, zoom)
+        if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
+            return self.cache[cache_key]
+
+        source, display = self.tile_bounds(key, zoom)
+        tile = self.levels[key[0]].crop(source)
+        size = (max(1, display[2] - display[0]), max(1, display[3] - display[1]))
+        if tile.size != size:
+            # Show real pixels when zoomed in so edges can be checked exactly
+            resample = Image.NEAREST if zoom > 1 else Image.BILINEAR
+            tile = tile.resize(size, resample)
+        photo = ImageTk.PhotoImage(tile)
+
+        self.cache[cache_key] = photo
+        while len(self.cache) > self.max_cached_tiles:
+            self.cache.popitem(last=False)
+        return photo
+
 
 class AutoBorderBoxTool:
     def __init__(self, root, image_path="rekordbox.png"):
         self.root = root
         self.image_path = image_path
+        # Only the header is read here; pixels are decoded on the I/O worker
         self.image = Image.open(image_path)
-        self.tk_image = ImageTk.PhotoImage(self.image)
+        self.loaded = False
+        self.results = queue.Queue()
+        
+        # Start zoomed to fit the screen; the canvas is only as big as the viewport
+        self.fit_zoom = min(1.0,
+                            root.winfo_screenwidth() * 0.9 / self.image.width,
+                            root.winfo_screenheight() * 0.85 / self.image.height)
+        self.zoom = self.fit_zoom
+        self.min_zoom = self.fit_zoom / 2
+        self.max_zoom = 8.0
+        view_width = int(self.image.width * self.zoom)
+        view_height = int(self.image.height * self.zoom)
         
         # Canvas setup
-        self.canvas = tk.Canvas(root, width=self.image.width, height=self.image.height)
-        self.canvas.pack()
-        self.background_image = self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
+        self.canvas = tk.Canvas(root, width=view_width, height=view_height, background="black",
+                                scrollregion=(0, 0, view_width, view_height))
+        self.canvas.pack(fill="both", expand=True)
+        self.tk_image = None
+        self.background_image = None
+        self.pyramid = None
+        self.tile_items = {}
+        self.loading_text = self.canvas.create_text(view_width // 2, view_height // 2,
+                                                    text="Loading...", fill="white")
         
         self.start_x = None
         self.start_y = None
-        self.current_box = None
-        self.second_box = None
+        self.press_x = None
+        self.press_y = None
+        self.band = None
         self.folder = "selected_boxes"
         
-        # Box coordinates list
-        self.box_coords_list = []
+        # Profile store remembers the regions picked for this resolution and layout
+        self.profiles = ProfileStore().load()
+        self.fingerprint = None
+        self.template_index = None  # Hashes of the saved templates, built on the first save
+        
+        # Detected boxes and the indices of the selected ones
+        self.boxes = []
+        self.selection = []
+        self.drag_threshold = 4  # Pixels the mouse must move before a click becomes a rubber band
+        
+        # Image loading and PNG writes happen on a single background worker so the Tk loop never stalls
+        self.io_executor = ThreadPoolExecutor(max_workers=1)
+        self.png_compress_level = 1  # Fast zlib setting; templates are small and rewritten often
         
         # Contract distance for inward bias
         self.contract_distance = 1  # Move edges inward by 3 pixels to avoid stray colors
+        
+        # Box detection with gradient-based edge refinement, prepared on the worker once the image is decoded
+        self.detector = None
+        self.min_edge_confidence = 0.5  # Edges below this fall back to the inward bias
+        self.box_confidence = None
+        self.metric = 'rgb'  # Colour distance used to grow boxes, see segmentation.BoxDetector
+        self.tolerance = DEFAULT_TOLERANCE[self.metric]
+        self.pending_recompute = None
+
+        self.io_executor.submit(self.load_image, (view_width, view_height))
+        self.root.after(20, self.poll_results)
 
         # Create control panel window
         self.control_panel = tk.Toplevel(root)
         self.control_panel.title("Control Panel")
-        self.control_panel.geometry("200x100")
+        self.control_panel.geometry("240x160")
+        
+        # Colour metric and tolerance; changing either recomputes the detected boxes
+        segmentation_frame = tk.Frame(self.control_panel)
+        segmentation_frame.pack(side="top", fill="x", padx=5, pady=5)
+        self.metric_var = tk.StringVar(value=self.metric)
+        tk.Label(segmentation_frame, text="Metric").grid(row=0, column=0, sticky="w")
+        tk.OptionMenu(segmentation_frame, self.metric_var, *METRICS,
+                      command=self.set_metric).grid(row=0, column=1, sticky="ew")
+        self.tolerance_var = tk.DoubleVar(value=self.tolerance)
+        tk.Label(segmentation_frame, text="Tolerance").grid(row=1, column=0, sticky="sw")
+        tk.Scale(segmentation_frame, variable=self.tolerance_var, from_=1, to=60, resolution=0.5,
+                 orient="horizontal", command=self.set_tolerance).grid(row=1, column=1, sticky="ew")
+        segmentation_frame.columnconfigure(1, weight=1)
         
         # Place buttons at the bottom of the control panel
         button_frame = tk.Frame(self.control_panel)
@@ -41,112 +185,361 @@ class AutoBorderBoxTool:
         merge_button = tk.Button(button_frame, text="Merge Boxes", command=self.merge_boxes)
         merge_button.pack(side="right", expand=True)
         
-        # Bind mouse click to create boxes
+        # Click to create boxes, shift-click to add to the selection, drag to rubber-band select
         self.canvas.bind("<Button-1>", self.set_start_point)
+        self.canvas.bind("<Shift-Button-1>", self.set_start_point)
+        self.canvas.bind("<B1-Motion>", self.drag_band)
+        self.canvas.bind("<ButtonRelease-1>", self.release_point)
+        self.canvas.bind("<Shift-ButtonRelease-1>", self.release_point)
+        
+        # Mouse wheel zooms around the cursor, right or middle drag pans
+        self.canvas.bind("<MouseWheel>", self.wheel_zoom)
+        self.canvas.bind("<Button-4>", lambda event: self.zoom_at(event.x, event.y, 1.25))
+        self.canvas.bind("<Button-5>", lambda event: self.zoom_at(event.x, event.y, 0.8))
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self.start_pan)
+            self.canvas.bind(f"<B{button}-Motion>", self.drag_pan)
+        self.canvas.bind("<Configure>", lambda event: self.render_view())
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+    def load_image(self, view_size):
+        """Decode the capture and prepare segmentation (runs on the I/O worker)."""
+        try:
+            image = Image.open(self.image_path)
+            if image.format == "JPEG":
+                # JPEG captures can be decoded straight at preview size
+                preview = Image.open(self.image_path)
+                preview.draft("RGB", view_size)
+                self.results.put(('preview', preview.convert("RGB").resize(view_size, Image.BILINEAR)))
+                image.load()
+            else:
+                image.load()
+                preview = image.convert("RGB").resize(view_size, Image.BILINEAR, reducing_gap=2.0)
+                self.results.put(('preview', preview))
+
+            fingerprint = frame_fingerprint(image)
+            detector = BoxDetector(image, tolerance=self.tolerance, metric=self.metric,
+                                   contract_distance=self.contract_distance,
+                                   min_edge_confidence=self.min_edge_confidence)
+            pyramid = TilePyramid(image)
+            self.results.put(('ready', (image, fingerprint, detector, pyramid)))
+        except Exception as e:
+            self.results.put(('error', e))
+
+    def poll_results(self):
+        """Pick up work finished by the I/O worker on the Tk thread."""
+        try:
+            while True:
+                kind, payload = self.results.get_nowait()
+                if kind == 'preview':
+                    self.tk_image = ImageTk.PhotoImage(payload)
+                    self.background_image = self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
+                    self.canvas.tag_lower(self.background_image)
+                elif kind == 'ready':
+                    self.image, self.fingerprint, self.detector, self.pyramid = payload
+                    self.loaded = True
+                    self.canvas.delete(self.loading_text)
+                    self.render_view()
+                    print(f"Loaded {self.image_path} ({self.image.width}x{self.image.height})")
+                elif kind == 'error':
+                    self.canvas.itemconfigure(self.loading_text, text=f"Failed to load image: {payload}")
+                    print(f"Failed to load {self.image_path}: {payload}")
+        except queue.Empty:
+            pass
+        if not self.loaded:
+            self.root.after(20, self.poll_results)
+
+    def render_view(self):
+        """Draw the tiles covering the viewport and drop the ones that left it."""
+        if self.pyramid is None:
+            return
+        view = (self.canvas.canvasx(0), self.canvas.canvasy(0),
+                self.canvas.canvasx(self.canvas.winfo_width()),
+                self.canvas.canvasy(self.canvas.winfo_height()))
+        wanted = set(self.pyramid.visible_tiles(self.zoom, view))
+        for key in list(self.tile_items):
+            if key not in wanted:
+                self.canvas.delete(self.tile_items.pop(key)[0])
+        for key in wanted - set(self.tile_items):
+            photo = self.pyramid.photo(key, self.zoom)
+            _, display = self.pyramid.tile_bounds(key, self.zoom)
+            item = self.canvas.create_image(display[0], display[1], anchor="nw", image=photo, tags="tile")
+            self.tile_items[key] = (item, photo)
+        self.canvas.tag_lower("tile")
+
+        # The fitted preview is only needed until the first tiles are drawn
+        if self.background_image is not None:
+            self.canvas.delete(self.background_image)
+            self.background_image = None
+            self.tk_image = None
+
+    def wheel_zoom(self, event):
+        self.zoom_at(event.x, event.y, 1.25 if event.delta > 0 else 0.8)
+
+    def zoom_at(self, x, y, factor):
+        """Zoom by `factor` keeping the image point under (x, y) in place."""
+        if not self.loaded:
+            return
+        zoom = min(self.max_zoom, max(self.min_zoom, self.zoom * factor))
+        if zoom == self.zoom:
+            return
+        image_x = self.canvas.canvasx(x) / self.zoom
+        image_y = self.canvas.canvasy(y) / self.zoom
+        self.zoom = zoom
+
+        # Tiles of the old zoom no longer line up
+        for item, _ in self.tile_items.values():
+            self.canvas.delete(item)
+        self.tile_items = {}
+        width, height = self.image.width * zoom, self.image.height * zoom
+        self.canvas.configure(scrollregion=(0, 0, width, height))
+        self.canvas.xview_moveto(max(0.0, (image_x * zoom - x) / width))
+        self.canvas.yview_moveto(max(0.0, (image_y * zoom - y) / height))
+        self.render_view()
+        self.redraw_boxes()
+
+    def start_pan(self, event):
+        self.canvas.scan_mark(event.x, event.y)
+
+    def drag_pan(self, event):
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.render_view()
+
+    def canvas_to_image(self, x, y):
+        """Map a window point to full-resolution image coordinates."""
+        image_x = int(self.canvas.canvasx(x) / self.zoom)
+        image_y = int(self.canvas.canvasy(y) / self.zoom)
+        return (min(max(image_x, 0), self.image.width - 1),
+                min(max(image_y, 0), self.image.height - 1))
+
+    def image_to_canvas(self, coords):
+        """Map a full-resolution box to canvas coordinates."""
+        return [c * self.zoom for c in coords]
 
     def set_start_point(self, event):
-        self.start_x, self.start_y = event.x, event.y
-        self.expand_box()
-        
-        # Only allow two boxes to be displayed (one red, one blue)
-        if len(self.box_coords_list) == 1:
-            # Clear previous blue box if it exists
-            if self.second_box:
-                self.canvas.delete(self.second_box)
-            self.second_box = self.canvas.create_rectangle(*self.apply_inward_bias(self.box_coords), outline="blue")
-        else:
-            # Clear previous red box if it exists
-            if self.current_box:
-                self.canvas.delete(self.current_box)
-            self.current_box = self.canvas.create_rectangle(*self.apply_inward_bias(self.box_coords), outline="red")
-            # Reset list to only keep two boxes
-            self.box_coords_list = []
+        self.press_x, self.press_y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        self.start_x, self.start_y = self.canvas_to_image(event.x, event.y)
 
-        # Store coordinates for potential merging
-        self.box_coords_list.append(self.box_coords)
+    def drag_band(self, event):
+        """Draw the rubber band once the mouse has moved far enough."""
+        if self.press_x is None:
+            return
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        if self.band is None:
+            if max(abs(x - self.press_x), abs(y - self.press_y)) < self.drag_threshold:
+                return
+            self.band = self.canvas.create_rectangle(self.press_x, self.press_y, x, y,
+                                                     outline="yellow", dash=(4, 2))
+        self.canvas.coords(self.band, self.press_x, self.press_y, x, y)
 
-    def expand_box(self):
-        x, y = self.start_x, self.start_y
-        width, height = self.image.size
-        pixels = self.image.load()
+    def release_point(self, event):
+        if not self.loaded:
+            print("Still loading the image, please wait.")
+            return
+        additive = bool(event.state & 0x0001)  # Shift held
+        if self.band is not None:
+            end_x, end_y = self.canvas_to_image(event.x, event.y)
+            band = [min(self.start_x, end_x), min(self.start_y, end_y),
+                    max(self.start_x, end_x), max(self.start_y, end_y)]
+            self.canvas.delete(self.band)
+            self.band = None
+            self.select_in_band(band, additive)
+            return
 
-        # Starting color
-        start_color = pixels[x, y][:3]
-        
-        # Initialize box boundaries
-        left, right, top, bottom = x, x, y, y
+        # A click inside a known box selects it instead of detecting it again
+        hit = self.box_at(self.start_x, self.start_y)
+        if hit is None:
+            self.expand_box()
+            self.boxes.append({'coords': self.box_coords,
+                               'seed': (self.start_x, self.start_y),
+                               'item': None})
+            hit = len(self.boxes) - 1
+        if additive:
+            if hit in self.selection:
+                self.selection.remove(hit)
+            else:
+                self.selection.append(hit)
+        else:
+            self.selection = [hit]
+        self.redraw_boxes()
+
+    def box_at(self, x, y):
+        """Return the index of the smallest known box containing a point."""
+        if not self.boxes:
+            return None
+        coords = np.array([box['coords'] for box in self.boxes])
+        inside = (coords[:, 0] <= x) & (x < coords[:, 2]) & (coords[:, 1] <= y) & (y < coords[:, 3])
+        if not inside.any():
+            return None
+        areas = (coords[:, 2] - coords[:, 0]) * (coords[:, 3] - coords[:, 1])
+        return int(np.argmin(np.where(inside, areas, np.inf)))
 
-        # Expand in each direction based on color matching
-        while right < width and self.color_difference(pixels[right, y][:3], start_color) < 20:
-            right += 1
+    def select_in_band(self, band, additive=False):
+        """Select every known box that intersects the rubber band."""
+        if not additive:
+            self.selection = []
+        if self.boxes:
+            coords = np.array([box['coords'] for box in self.boxes])
+            hits = np.nonzero((coords[:, 0] < band[2]) & (coords[:, 2] > band[0]) &
+                              (coords[:, 1] < band[3]) & (coords[:, 3] > band[1]))[0]
+            for index in hits.tolist():
+                if index not in self.selection:
+                    self.selection.append(index)
+        self.redraw_boxes()
 
-        while bottom < height and self.color_difference(pixels[x, bottom][:3], start_color) < 20:
-            bottom += 1
+    def redraw_boxes(self):
+        """Draw selected boxes in red and the other known boxes in blue."""
+        for index, box in enumerate(self.boxes):
+            if box['item']:
+                self.canvas.delete(box['item'])
+            if index in self.selection:
+                colour = "red"
+            else:
+                colour = "green" if box.get('merged') else "blue"
+            box['item'] = self.canvas.create_rectangle(*self.image_to_canvas(box['coords']), outline=colour)
 
-        while left > 0 and self.color_difference(pixels[left, y][:3], start_color) < 20:
-            left -= 1
+    def expand_box(self):
+        # Grow the box from the clicked point and place its borders precisely
+        coarse = self.detector.expand(self.start_x, self.start_y)
+        refined, confidence = self.detector.refine([coarse])
+        self.box_coords = refined[0]
+        self.box_confidence = confidence[0]
+        print("Edge confidence (left, top, right, bottom): "
+              + ", ".join(f"{c:.2f}" for c in self.box_confidence))
 
-        while top > 0 and self.color_difference(pixels[x, top][:3], start_color) < 20:
-            top -= 1
+    def set_metric(self, metric):
+        """Switch the colour metric, starting from its default tolerance."""
+        self.metric = metric
+        self.tolerance_var.set(DEFAULT_TOLERANCE[metric])
+        self.set_tolerance(DEFAULT_TOLERANCE[metric])
 
-        # Update the box coordinates
-        self.box_coords = [left, top, right, bottom]
+    def set_tolerance(self, value):
+        self.tolerance = float(value)
+        # Slider drags fire many events; recompute once the Tk loop is idle
+        if self.pending_recompute is None:
+            self.pending_recompute = self.root.after_idle(self.recompute_boxes)
 
-    def color_difference(self, color1, color2):
-        """Calculate the color difference based on RGB components."""
-        return sum(abs(color1[i] - color2[i]) for i in range(3))
+    def recompute_boxes(self):
+        """Detect every box again from its seed with the current metric and tolerance."""
+        self.pending_recompute = None
+        if self.detector is None:
+            return
+        self.detector.metric = self.metric
+        self.detector.tolerance = self.tolerance
+        # Merged boxes have no single seed and keep their bounds
+        detected = [box for box in self.boxes if not box.get('merged')]
+        coords, _ = self.detector.detect([box['seed'] for box in detected])
+        for box, box_coords in zip(detected, coords):
+            box['coords'] = box_coords
+        self.redraw_boxes()
 
     def apply_inward_bias(self, box_coords):
         """Contract box edges inward by `contract_distance` pixels to avoid outer colors."""
-        left, top, right, bottom = box_coords
-        left += self.contract_distance
-        top += self.contract_distance
-        right -= self.contract_distance
-        bottom -= self.contract_distance
-        return [left, top, right, bottom]
+        return inset([box_coords], self.contract_distance)[0].tolist()
+
+    def union_of_rectangles(self, boxes):
+        """Bounding box and covered area of the union of rectangles.
+
+        The coverage is computed with a sweep over the distinct x edges, which
+        lets merge_boxes warn when the result mostly covers empty space.
+        """
+        coords = np.asarray(boxes, dtype=np.int64)
+        bounds = [int(edge) for edge in union_bounds(coords)]
+        xs = np.unique(coords[:, [0, 2]])
+        covered = 0
+        for x0, x1 in zip(xs[:-1], xs[1:]):
+            spanning = coords[(coords[:, 0] <= x0) & (coords[:, 2] >= x1)]
+            if len(spanning) == 0:
+                continue
+            spans = spanning[np.argsort(spanning[:, 1]), 1:4:2]
+            # Merge the overlapping vertical spans of this slab
+            length, current_top, current_bottom = 0, spans[0][0], spans[0][1]
+            for top, bottom in spans[1:]:
+                if top > current_bottom:
+                    length += current_bottom - current_top
+                    current_top, current_bottom = top, bottom
+                else:
+                    current_bottom = max(current_bottom, bottom)
+            length += current_bottom - current_top
+            covered += int(x1 - x0) * int(length)
+        return bounds, covered
 
     def merge_boxes(self):
-        """Merge the two boxes into a single larger box."""
-        if len(self.box_coords_list) < 2:
-            print("Need two boxes to merge.")
+        """Merge all selected boxes into a single larger box."""
+        if len(self.selection) < 2:
+            print("Select at least two boxes to merge.")
             return
 
-        # Take the two boxes
-        box1 = self.box_coords_list[0]
-        box2 = self.box_coords_list[1]
+        # Boxes are already biased inward, so the union needs no extra contraction
+        selected = [self.boxes[index] for index in self.selection]
+        bounds, covered = self.union_of_rectangles([box['coords'] for box in selected])
+        area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+        print(f"Merged {len(selected)} boxes into {bounds} ({covered / area:.0%} covered)")
+
+        # Replace the selected boxes with the merged one
+        for box in selected:
+            if box['item']:
+                self.canvas.delete(box['item'])
+        self.boxes = [box for index, box in enumerate(self.boxes) if index not in self.selection]
+        self.boxes.append({'coords': bounds, 'seed': None, 'item': None, 'merged': True})
+        self.selection = [len(self.boxes) - 1]
+        self.redraw_boxes()
 
-        # Calculate combined box coordinates
-        left = min(box1[0], box2[0]) + self.contract_distance
-        top = min(box1[1], box2[1]) + self.contract_distance
-        right = max(box1[2], box2[2]) - self.contract_distance
-        bottom = max(box1[3], box2[3]) - self.contract_distance
+    def box_name(self, box):
+        """Template file name of a box, from its seed or, when merged, its bounds."""
+        if box.get('merged'):
+            # Named apart from its parts so saving it never overwrites one of them
+            return "merged_{}_{}_{}_{}.png".format(*box['coords'])
+        return f"box_{box['seed'][0]}_{box['seed'][1]}.png"
 
-        # Clear individual boxes
-        if self.current_box:
-            self.canvas.delete(self.current_box)
-        if self.second_box:
-            self.canvas.delete(self.second_box)
+    def save_boxes(self):
+        """Crop every selected box and write them all in one background batch."""
+        if not self.selection:
+            print("No boxes selected to save.")
+            return
 
-        # Draw the merged box in green
-        self.current_box = self.canvas.create_rectangle(left, top, right, bottom, outline="green")
-        self.canvas.update()  # Update canvas after drawing combined box
+        # Cropping is quick; encoding and writing the PNGs is not
+        batch = []
+        for index in self.selection:
+            box = self.boxes[index]
+            name = self.box_name(box)
+            batch.append((name, list(box['coords']), self.image.crop(box['coords'])))
+        self.io_executor.submit(self.write_boxes, batch)
+        print(f"Saving {len(batch)} boxes in the background...")
 
-        # Update the stored coordinates for the merged box
-        self.box_coords = [left, top, right, bottom]
-        self.box_coords_list = [self.box_coords]  # Reset to only the merged box
+    def write_boxes(self, batch):
+        """Write cropped boxes and record their regions (runs on the I/O worker)."""
+        try:
+            # Create the folder if it doesn't exist
+            os.makedirs(self.folder, exist_ok=True)
+            if self.template_index is None:
+                self.template_index = TemplateIndex.from_folder(self.folder)
+            width, height = self.image.size
+            regions = profile_regions(self.profiles.find(width, height, self.fingerprint))
+            for name, coords, cropped_image in batch:
+                # Clicking the same panel twice would give a second template of it
+                duplicate = self.template_index.duplicate_of(cropped_image, coords, regions)
+                if duplicate and duplicate != name:
+                    print(f"Skipped {name}, same panel as {duplicate}")
+                    continue
+                lookalikes = [other for other in self.template_index.lookalikes(cropped_image) if other != name]
+                if lookalikes:
+                    print(f"Note: {name} looks like {', '.join(lookalikes)} (kept, different region)")
+                cropped_image.save(f"{self.folder}/{name}", compress_level=self.png_compress_level)
+                print(f"Box saved as {name}")
+                if name not in self.template_index.names:
+                    self.template_index.add(name, cropped_image)
+                regions[name] = coords
+                # Record where the box came from so apply.py can reuse it
+                self.profiles.record_region(width, height, self.fingerprint, name, coords)
+            self.profiles.save()
+        except Exception as e:
+            print(f"Failed to save boxes: {e}")
 
-    def save_boxes(self):
-        # Create the folder if it doesn't exist
-        os.makedirs(self.folder, exist_ok=True)
-        
-        if self.box_coords:
-            # Apply inward bias before saving
-            coords = self.apply_inward_bias(self.box_coords)
-            # Crop the image to the adjusted bounding box
-            cropped_image = self.image.crop(coords)
-            # Save the cropped image
-            cropped_image.save(f"{self.folder}/box_{self.start_x}_{self.start_y}.png")
-            print(f"Box saved as box_{self.start_x}_{self.start_y}.png")
+    def close(self):
+        """Wait for pending saves before closing the window."""
+        self.io_executor.shutdown(wait=True)
+        self.root.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
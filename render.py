@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from layout_format import load_layout
+
+RENDER_VERSION = 1  # Part of every cache key; bump when the output changes
+CACHE_FOLDER = "renders"
+
+
+def box_matrix(box, source_size, scale):
+    """3x3 matrix taking source image pixels to output canvas pixels.
+
+    Follows LayoutBox: crop, scale to width x height, rotate clockwise about
+    the centre and place the rotated bounding box at (x, y); then scale the
+    whole canvas by `scale`.
+    """
+    left, top, right, bottom = box.crop
+    crop_width = max(1e-6, source_size[0] - left - right)
+    crop_height = max(1e-6, source_size[1] - top - bottom)
+    angle = math.radians(box.rotation)
+    cos, sin = math.cos(angle), math.sin(angle)
+    bound_width = abs(box.width * cos) + abs(box.height * sin)
+    bound_height = abs(box.width * sin) + abs(box.height * cos)
+
+    to_box = np.array([[box.width / crop_width, 0, -left * box.width / crop_width],
+                       [0, box.height / crop_height, -top * box.height / crop_height],
+                       [0, 0, 1]])
+    # With y pointing down this matrix turns clockwise
+    rotate = np.array([[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]])
+    centre = np.array([[1, 0, -box.width / 2], [0, 1, -box.height / 2], [0, 0, 1]])
+    place = np.array([[1, 0, box.x + bound_width / 2], [0, 1, box.y + bound_height / 2], [0, 0, 1]])
+    to_output = np.diag([scale[0], scale[1], 1.0])
+    return to_output @ place @ rotate @ centre @ to_box
+
+
+def render_box(source, matrix, output_size):
+    """Resample one box onto its patch of the output; None if it is off canvas.
+
+    The crop, scale and rotation are one affine transform, so every output
+    pixel is sampled from the source exactly once.
+    """
+    corners = matrix @ np.array([[0, source.width, 0, source.width],
+                                 [0, 0, source.height, source.height],
+                                 [1, 1, 1, 1]])
+    left = max(0, math.floor(corners[0].min()))
+    top = max(0, math.floor(corners[1].min()))
+    right = min(output_size[0], math.ceil(corners[0].max()))
+    bottom = min(output_size[1], math.ceil(corners[1].max()))
+    if right <= left or bottom <= top:
+        return None
+
+    # Pillow wants the inverse mapping, from patch pixels back to the source
+    inverse = np.linalg.inv(matrix) @ np.array([[1, 0, left], [0, 1, top], [0, 0, 1]])
+    # Premultiplied alpha keeps the transparent outside from darkening the edges
+    patch = source.convert("RGBa").transform((right - left, bottom - top), Image.AFFINE,
+                                             tuple(inverse[:2].ravel()), Image.BICUBIC)
+    return (left, top), patch.convert("RGBA")
+
+
+def resolve_source(path, base_folder):
+    """Find a box's image as given, or relative to the layout file."""
+    if os.path.exists(path) or not base_folder:
+        return path
+    return os.path.join(base_folder, path)
+
+
+def render_layout(layout, size=(1920, 1080), background=(0, 0, 0), base_folder=None, workers=4):
+    """Composite the placed boxes of a layout onto a canvas of `size`.
+
+    Boxes are resampled in parallel and composited in layout order, so the
+    result does not depend on thread timing. Ops logged after the snapshot
+    are not replayed; export the layout from format.py to fold them in.
+    """
+    scale = (size[0] / layout.canvas_size[0], size[1] / layout.canvas_size[1])
+    if layout.pending_ops:
+        print(f"Rendering the snapshot only, {layout.pending_ops} logged ops are not applied")
+    boxes = [box for box in layout.boxes if box.placed]
+
+    def render(box):
+        with Image.open(resolve_source(box.path, base_folder)) as source:
+            source = source.convert("RGBA")
+        return render_box(source, box_matrix(box, source.size, scale), size)
+
+    canvas = Image.new("RGBA", size, tuple(background) + (255,))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for patch in executor.map(render, boxes):
+            if patch is not None:
+                position, image = patch
+                canvas.alpha_composite(image, position)
+    return canvas.convert("RGB")
+
+
+def layout_hash(layout, size, background=(0, 0, 0), base_folder=None):
+    """Cache key covering the snapshot, the output settings and the source images."""
+    digest = hashlib.sha256()
+    digest.update(f"{RENDER_VERSION}:{size[0]}x{size[1]}:{tuple(background)}".encode())
+    digest.update(layout.to_bytes(include_ops=False))
+    for box in layout.boxes:
+        if box.placed:
+            with open(resolve_source(box.path, base_folder), 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def save_render(image, path):
+    """Write a render with fixed settings and no metadata, so equal renders are equal files."""
+    image.save(path, format="PNG", compress_level=6, optimize=False)
+
+
+def render_cached(layout, size=(1920, 1080), background=(0, 0, 0), base_folder=None,
+                  cache_folder=CACHE_FOLDER):
+    """Path of the render of a layout, rendering it only if it is not cached yet."""
+    os.makedirs(cache_folder, exist_ok=True)
+    path = os.path.join(cache_folder, f"{layout_hash(layout, size, background, base_folder)}.png")
+    if not os.path.exists(path):
+        # Write to a temporary name so an interrupted render is never picked up
+        temporary = f"{path}.tmp"
+        save_render(render_layout(layout, size, background, base_folder), temporary)
+        os.replace(temporary, path)
+    return path
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render format.py layouts to PNG without opening Qt.")
+    parser.add_argument("layouts", nargs="+", help=".rbl layout files")
+    parser.add_argument("--size", type=parse_size, default=(480, 270), help="output size, e.g. 1920x1080")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="folder for cached renders")
+    args = parser.parse_args()
+
+    for layout_path in args.layouts:
+        layout = load_layout(layout_path)
+        path = render_cached(layout, args.size, base_folder=os.path.dirname(layout_path),
+                             cache_folder=args.cache)
+        print(f"{layout_path}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import numpy as np
+from geometry import inset
+
+
+class EdgeRefiner:
+    """Sub-pixel placement of box borders from gradient profiles.
+
+    Only the 2r+2 lines across each side of a box are read, so refining
+    costs O(perimeter) per box and nothing image-wide is built up front.
+    All sides of all boxes are then located together with array operations.
+    """
+
+    def __init__(self, image, search_radius=3, corner_margin=2):
+        self.search_radius = search_radius  # Pixels searched either side of a coarse edge
+        self.corner_margin = corner_margin  # Pixels skipped at the ends of each side
+        self.pixels = image if isinstance(image, np.ndarray) else np.asarray(image.convert("RGB"))
+        self.height, self.width = self.pixels.shape[:2]
+
+    def _profiles(self, positions, span_start, span_end, vertical):
+        """Mean colour of each line crossing a side, shape (N, 2r+2, 3)."""
+        offsets = np.arange(-self.search_radius - 1, self.search_radius + 1)
+        limit = self.width if vertical else self.height
+        lines = np.clip(positions[:, None] + offsets[None, :], 0, limit - 1)
+        profiles = np.empty((len(positions), len(offsets), 3))
+        for i, (start, end) in enumerate(zip(span_start, span_end)):
+            # Strip of the side's span across its 2r+2 lines
+            strip = self.pixels[start:end, lines[i]] if vertical else self.pixels[lines[i], start:end]
+            profiles[i] = strip.mean(axis=0 if vertical else 1)
+        return profiles
+
+    def _locate(self, profiles, positions):
+        """Find the strongest step in each profile with a parabolic sub-pixel fit."""
+        gradient = np.linalg.norm(np.diff(profiles, axis=1), axis=2)
+        count = len(positions)
+        rows = np.arange(count)
+        peak = np.argmax(gradient, axis=1)
+        # Peaks on the window border cannot be interpolated
+        inner = np.clip(peak, 1, gradient.shape[1] - 2)
+        before = gradient[rows, inner - 1]
+        centre = gradient[rows, inner]
+        after = gradient[rows, inner + 1]
+        curvature = before - 2 * centre + after
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shift = np.where(curvature < 0, 0.5 * (before - after) / curvature, 0.0)
+        shift = np.where(peak == inner, np.clip(shift, -0.5, 0.5), 0.0)
+        # Gradient i lies between lines i and i+1, i.e. on pixel edge position - r + i
+        edges = positions - self.search_radius + peak + shift
+
+        # Confidence compares the peak to the strongest response away from it
+        masked = gradient.copy()
+        for neighbour in (-1, 0, 1):
+            masked[rows, np.clip(peak + neighbour, 0, gradient.shape[1] - 1)] = 0
+        second = masked.max(axis=1)
+        peak_value = gradient[rows, peak]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            confidence = np.where(peak_value > 0, 1 - second / peak_value, 0.0)
+        return edges, np.clip(confidence, 0.0, 1.0)
+
+    def refine(self, boxes):
+        """Refine boxes given as [left, top, right, bottom] rows.
+
+        Coarse boxes are in the `expand_box` convention, where each coordinate
+        is the first pixel that no longer matches. Returns float edges on pixel
+        boundaries (suitable for cropping) and a confidence in [0, 1] for each
+        edge, both shaped (N, 4).
+        """
+        boxes = np.atleast_2d(np.asarray(boxes, dtype=np.int64))
+        if boxes.size == 0:
+            return np.zeros((0, 4)), np.zeros((0, 4))
+        left, top, right, bottom = boxes.T
+        margin = self.corner_margin
+
+        # Spans run along the inside of each side, away from the corners
+        ys = np.clip(top + 1 + margin, 0, self.height - 1)
+        ye = np.clip(bottom - margin, ys + 1, self.height)
+        xs = np.clip(left + 1 + margin, 0, self.width - 1)
+        xe = np.clip(right - margin, xs + 1, self.width)
+
+        # The coarse borders sit on pixel edges left + 1 and right (same for y)
+        columns = np.concatenate([left + 1, right])
+        column_profiles = self._profiles(columns, np.tile(ys, 2), np.tile(ye, 2), vertical=True)
+        rows = np.concatenate([top + 1, bottom])
+        row_profiles = self._profiles(rows, np.tile(xs, 2), np.tile(xe, 2), vertical=False)
+
+        column_edges, column_confidence = self._locate(column_profiles, columns)
+        row_edges, row_confidence = self._locate(row_profiles, rows)
+
+        count = len(boxes)
+        edges = np.stack([column_edges[:count], row_edges[:count],
+                          column_edges[count:], row_edges[count:]], axis=1)
+        confidence = np.stack([column_confidence[:count], row_confidence[:count],
+                               column_confidence[count:], row_confidence[count:]], axis=1)
+        return edges, confidence
+
+
+def snap_edges(coarse_boxes, edges, confidence, contract_distance=1, min_confidence=0.5):
+    """Turn refined edges into integer crop boxes.
+
+    Confident edges are rounded inward so partly covered border pixels are
+    left out. Edges below `min_confidence` keep the old behaviour of moving
+    the coarse edge inward by `contract_distance`.
+    """
+    coarse = np.atleast_2d(np.asarray(coarse_boxes, dtype=np.int64))
+    rounded = np.concatenate([np.ceil(edges[:, :2] - 1e-6), np.floor(edges[:, 2:] + 1e-6)], axis=1)
+    contracted = inset(coarse, contract_distance)
+    snapped = np.where(confidence >= min_confidence, rounded, contracted).astype(np.int64)
+    # Never let a refinement invert a box
+    snapped[:, 2] = np.maximum(snapped[:, 2], snapped[:, 0] + 1)
+    snapped[:, 3] = np.maximum(snapped[:, 3], snapped[:, 1] + 1)
+    return snapped
+
+
+# sRGB to CIELAB (D65). Gamma expansion goes through a 256-entry table, so
+# converting a line of pixels is one lookup and one matrix product.
+SRGB_TO_LINEAR = np.array([c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+                           for c in np.arange(256) / 255.0], dtype=np.float32)
+RGB_TO_XYZ = np.array([[0.4124, 0.3576, 0.1805],
+                       [0.2126, 0.7152, 0.0722],
+                       [0.0193, 0.1192, 0.9505]], dtype=np.float32)
+WHITE_D65 = np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+LAB_EPSILON = (6 / 29) ** 3
+
+
+def rgb_to_lab(pixels):
+    """Convert uint8 RGB pixels of any shape (..., 3) to float32 CIELAB."""
+    xyz = SRGB_TO_LINEAR[pixels] @ RGB_TO_XYZ.T / WHITE_D65
+    f = np.where(xyz > LAB_EPSILON, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16,
+                     500 * (f[..., 0] - f[..., 1]),
+                     200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+# Colour distance metrics and the tolerance each one starts with
+METRICS = ['rgb', 'lab', 'adaptive']
+DEFAULT_TOLERANCE = {'rgb': 20, 'lab': 10, 'adaptive': 3}
+
+
+class BoxDetector:
+    """Click-to-box detection shared by rekordboxes.py and the batch pipeline.
+
+    A box grows from a seed point along its row and column until the colour
+    stops matching, and its borders are then refined with an EdgeRefiner.
+    How colours are compared depends on `metric`:
+
+    rgb       L1 distance over RGB from the seed of at least `tolerance`.
+    lab       CIELAB distance (delta E 1976) from the seed of at least
+              `tolerance`, so similar looking greys stay together.
+    adaptive  A step of at least `tolerance` delta E between neighbouring
+              pixels that also stands out from the local variation along
+              the line. Smooth gradients are followed instead of split; a
+              drift of `drift_factor` times the tolerance from the seed
+              still ends the box.
+    """
+
+    def __init__(self, image, tolerance=20, contract_distance=1, min_edge_confidence=0.5,
+                 metric='rgb', noise_window=15, noise_factor=3.0, drift_factor=4.0):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown colour metric '{metric}'")
+        self.tolerance = tolerance
+        self.metric = metric
+        self.noise_window = noise_window  # Pixels averaged for the local variation
+        self.noise_factor = noise_factor  # How far a step must exceed the local variation
+        self.drift_factor = drift_factor
+        self.contract_distance = contract_distance
+        self.min_edge_confidence = min_edge_confidence
+        self.pixels = np.asarray(image.convert("RGB"))
+        self.height, self.width = self.pixels.shape[:2]
+        self.refiner = EdgeRefiner(self.pixels)
+        # Each scanned row and column is converted to Lab at most once per image
+        self.lab_rows = {}
+        self.lab_columns = {}
+
+    def lab_row(self, y):
+        if y not in self.lab_rows:
+            self.lab_rows[y] = rgb_to_lab(self.pixels[y])
+        return self.lab_rows[y]
+
+    def lab_column(self, x):
+        if x not in self.lab_columns:
+            self.lab_columns[x] = rgb_to_lab(self.pixels[:, x])
+        return self.lab_columns[x]
+
+    def stops(self, line, lab, seed):
+        """Masks of pixels that end the walk forward and backward from `seed`."""
+        if self.metric == 'rgb':
+            differs = np.abs(line.astype(np.int16) - line[seed].astype(np.int16)).sum(axis=1) >= self.tolerance
+            return differs, differs
+        distance = np.linalg.norm(lab - lab[seed], axis=1)
+        if self.metric == 'lab':
+            differs = distance >= self.tolerance
+            return differs, differs
+
+        steps = np.linalg.norm(np.diff(lab, axis=0), axis=1)
+        sums = np.concatenate([[0.0], np.cumsum(steps)])
+        half = self.noise_window // 2
+        low = np.clip(np.arange(len(steps)) - half, 0, len(steps))
+        high = np.clip(np.arange(len(steps)) + half + 1, 0, len(steps))
+        noise = (sums[high] - sums[low]) / (high - low)
+        edges = (steps >= self.tolerance) & (steps >= self.noise_factor * noise)
+        drifted = distance >= self.tolerance * self.drift_factor
+        # An edge between pixels i and i + 1 stops a forward walk at i + 1 and a backward one at i
+        forward = drifted.copy()
+        forward[1:] |= edges
+        backward = drifted.copy()
+        backward[:-1] |= edges
+        return forward, backward
+
+    def expand(self, x, y):
+        """Coarse box around a seed, as [left, top, right, bottom] border pixels."""
+        use_lab = self.metric != 'rgb'
+        row_forward, row_backward = self.stops(self.pixels[y], self.lab_row(y) if use_lab else None, x)
+        column_forward, column_backward = self.stops(self.pixels[:, x],
+                                                     self.lab_column(x) if use_lab else None, y)
+
+        # Same stopping rules as walking pixel by pixel from the seed
+        right = np.flatnonzero(row_forward[x + 1:])
+        right = x + 1 + right[0] if len(right) else self.width
+        left = np.flatnonzero(row_backward[:x])
+        left = left[-1] if len(left) else 0
+        bottom = np.flatnonzero(column_forward[y + 1:])
+        bottom = y + 1 + bottom[0] if len(bottom) else self.height
+        top = np.flatnonzero(column_backward[:y])
+        top = top[-1] if len(top) else 0
+        return [int(left), int(top), int(right), int(bottom)]
+
+    def refine(self, coarse_boxes):
+        """Refine coarse boxes into crop boxes with per-edge confidence."""
+        edges, confidence = self.refiner.refine(coarse_boxes)
+        snapped = snap_edges(coarse_boxes, edges, confidence,
+                             self.contract_distance, self.min_edge_confidence)
+        return snapped.tolist(), confidence.tolist()
+
+    def detect(self, seeds):
+        """Detect and refine the boxes around a batch of (x, y) seeds."""
+        if not seeds:
+            return [], []
+        return self.refine([self.expand(x, y) for x, y in seeds])
@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from PIL import Image
+from profiles import frame_fingerprint
+
+# Templates whose hashes differ in at most this many of 64 bits look alike
+MAX_DISTANCE = 6
+# Lookalikes must also be within this fraction of each other's size
+SIZE_TOLERANCE = 0.1
+# Lookalikes whose capture regions overlap this much are the same panel
+MIN_OVERLAP = 0.5
+
+
+def template_hash(image):
+    """64-bit difference hash of a template as an integer."""
+    return int(frame_fingerprint(image), 16)
+
+
+def overlap(region1, region2):
+    """Intersection over union of two [left, top, right, bottom] regions."""
+    width = min(region1[2], region2[2]) - max(region1[0], region2[0])
+    height = min(region1[3], region2[3]) - max(region1[1], region2[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    area1 = (region1[2] - region1[0]) * (region1[3] - region1[1])
+    area2 = (region2[2] - region2[0]) * (region2[3] - region2[1])
+    return intersection / (area1 + area2 - intersection)
+
+
+def profile_regions(profile):
+    """Regions of a profile as name -> [left, top, right, bottom]."""
+    if not profile:
+        return {}
+    return {r['name']: [r['x1'], r['y1'], r['x2'], r['y2']] for r in profile.get('regions', [])}
+
+
+class TemplateIndex:
+    """Perceptual hashes of templates, for finding near-duplicates.
+
+    Looking alike is not enough to merge two templates: Rekordbox draws the
+    panels of both decks the same way, so the deck 1 and deck 2 versions of
+    a panel hash almost identically. A lookalike only counts as a duplicate
+    when its recorded region overlaps, i.e. the same panel was clicked twice.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE, size_tolerance=SIZE_TOLERANCE):
+        self.max_distance = max_distance
+        self.size_tolerance = size_tolerance
+        self.names = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.sizes = np.zeros((0, 2))
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_folder(cls, folder, **kwargs):
+        index = cls(**kwargs)
+        if os.path.isdir(folder):
+            for file in sorted(os.listdir(folder)):
+                if file.endswith('.png'):
+                    with Image.open(os.path.join(folder, file)) as image:
+                        index.add(file, image)
+        return index
+
+    def add(self, name, image):
+        self.names.append(name)
+        self.hashes = np.append(self.hashes, np.uint64(template_hash(image)))
+        self.sizes = np.vstack([self.sizes, image.size])
+
+    def lookalikes(self, image):
+        """Names of indexed templates that look like `image`."""
+        if not self.names:
+            return []
+        differing = np.bitwise_xor(self.hashes, np.uint64(template_hash(image)))
+        distances = np.unpackbits(differing.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        size_error = np.abs(self.sizes / np.array(image.size, dtype=np.float64) - 1).max(axis=1)
+        close = (distances <= self.max_distance) & (size_error <= self.size_tolerance)
+        return [self.names[i] for i in np.flatnonzero(close)]
+
+    def duplicate_of(self, image, region, regions):
+        """Indexed template of the same panel as `image` at `region`, or None.
+
+        `regions` maps template names to their regions in the same capture.
+        """
+        for name in self.lookalikes(image):
+            other = regions.get(name)
+            if region is not None and other is not None and overlap(region, other) >= MIN_OVERLAP:
+                return name
+        return None
@@ -0,0 +1,75 @@
+import numpy as np
+from PIL import Image
+
+# OBS alignment flags (obs_align_* in libobs); 0 means centred on both axes
+ALIGN_LEFT = 1
+ALIGN_RIGHT = 2
+ALIGN_TOP = 4
+ALIGN_BOTTOM = 8
+
+
+def item_rect(transform):
+    """Canvas rectangle [left, top, right, bottom] covered by a scene item.
+
+    Uses the width/height OBS reports after crop and scale, with the item
+    position interpreted through its alignment flags.
+    """
+    width = transform.get('width', 0)
+    height = transform.get('height', 0)
+    if round(transform.get('rotation', 0)) % 180 == 90:
+        width, height = height, width
+    alignment = transform.get('alignment', 0)
+    left = transform.get('positionX', 0)
+    top = transform.get('positionY', 0)
+    if alignment & ALIGN_RIGHT:
+        left -= width
+    elif not alignment & ALIGN_LEFT:
+        left -= width / 2
+    if alignment & ALIGN_BOTTOM:
+        top -= height
+    elif not alignment & ALIGN_TOP:
+        top -= height / 2
+    return [left, top, left + width, top + height]
+
+
+def similarity(region, template):
+    """Zero-mean normalised cross-correlation of two greyscale arrays, in [0, 1].
+
+    Flat regions have no texture to correlate, so they are compared by their
+    mean brightness instead.
+    """
+    region = region - region.mean()
+    template = template - template.mean()
+    energy = np.sqrt((region * region).sum() * (template * template).sum())
+    if energy < 1e-6 * region.size:
+        return 1.0 - abs(float(region.mean() - template.mean())) / 255.0
+    return float(max(0.0, (region * template).sum() / energy))
+
+
+def score_boxes(frame, boxes, canvas_size):
+    """Score how well each box on a low resolution program frame matches.
+
+    `boxes` maps a name to (template image, canvas rect, rotation); rects are
+    in OBS canvas pixels and are scaled to the frame here. Returns a dict of
+    name -> score, with 0.0 for boxes that fall outside the frame.
+    """
+    gray = np.asarray(frame.convert("L"), dtype=np.float64)
+    scale_x = frame.width / canvas_size[0]
+    scale_y = frame.height / canvas_size[1]
+    scores = {}
+    for name, (template, rect, rotation) in boxes.items():
+        left = max(0, int(round(rect[0] * scale_x)))
+        top = max(0, int(round(rect[1] * scale_y)))
+        right = min(frame.width, int(round(rect[2] * scale_x)))
+        bottom = min(frame.height, int(round(rect[3] * scale_y)))
+        if right - left < 2 or bottom - top < 2:
+            scores[name] = 0.0
+            continue
+        expected = template.convert("L")
+        if rotation:
+            # OBS rotates clockwise, Pillow counter-clockwise
+            expected = expected.rotate(-rotation, expand=True)
+        expected = expected.resize((right - left, bottom - top), Image.BILINEAR)
+        scores[name] = similarity(gray[top:bottom, left:right],
+                                  np.asarray(expected, dtype=np.float64))
+    return scores